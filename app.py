@@ -1,14 +1,28 @@
 import os
+import time
+import uuid
+
 import uvicorn
 from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
 from fastapi.templating import Jinja2Templates
 from starlette import status
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import RedirectResponse
+from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse
 from starlette.staticfiles import StaticFiles
 
-from controller.app_controller import application
 from controller.auth_controller import authentication
+from face_authentication.config.database import MongodbClient
+from face_authentication.constants.server import DEPLOYMENT_MODE
+from face_authentication.logger import get_stages, logging, start_request
+from face_authentication.metrics import REQUEST_SECONDS
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory='static'), name="static")
@@ -16,6 +30,98 @@ app.mount("/static", StaticFiles(directory='static'), name="static")
 templates = Jinja2Templates(directory= os.path.join(os.getcwd(), "templates"))
 
 
+if DEPLOYMENT_MODE == "full":
+    # Imported only here, auth-only workers never load the ML stack
+    from controller.app_controller import application
+    from face_authentication.inference.executor import InferenceExecutor
+
+    @app.on_event("startup")
+    def load_models():
+        # Build and warm the models before the worker starts accepting traffic
+        InferenceExecutor().start()
+
+    @app.on_event("shutdown")
+    def stop_inference():
+        InferenceExecutor().shutdown()
+
+elif DEPLOYMENT_MODE != "auth":
+    raise ValueError(f"Unknown deployment mode: {DEPLOYMENT_MODE}")
+
+
+@app.on_event("startup")
+def open_database():
+    MongodbClient()
+    MongodbClient.create_indexes()
+
+
+@app.on_event("shutdown")
+def close_database():
+    MongodbClient.close()
+
+
+# With several uvicorn or inference worker processes every process writes its
+# samples to this directory, which must be emptied before the deployment
+# starts, and /metrics merges them. prometheus_client reads it at import.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+@app.on_event("shutdown")
+def close_metrics():
+    if PROMETHEUS_MULTIPROC_DIR:
+        # Drop the live gauges of this worker from the merged metrics
+        multiprocess.mark_process_dead(os.getpid())
+
+
+@app.get("/health")
+def health():
+    if DEPLOYMENT_MODE == "full" and not InferenceExecutor.is_ready():
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": False, "message": "Models are loading"},
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK, content={"status": True, "message": "Ready"}
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    registry = REGISTRY
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    start_request(request_id)
+    start = time.perf_counter()
+    response = await call_next(request)
+    seconds = time.perf_counter() - start
+    # The route template keeps the label set bounded, unknown paths share one
+    route = request.scope.get("route")
+    route = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.labels(
+        method=request.method, route=route, status=response.status_code
+    ).observe(seconds)
+    logging.info(
+        "Request completed",
+        extra={
+            "fields": {
+                "method": request.method,
+                "route": route,
+                "status": response.status_code,
+                "duration_ms": round(1000 * seconds, 3),
+                "stages": get_stages(),
+            }
+        },
+    )
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 @app.get("/")
 def read_root():
     try:
@@ -30,7 +136,8 @@ def read_root():
 
 app.include_router(authentication.router)
 
-app.include_router(application.router)
+if DEPLOYMENT_MODE == "full":
+    app.include_router(application.router)
 
 app.add_middleware(SessionMiddleware, secret_key="!secret")
 
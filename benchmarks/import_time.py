@@ -0,0 +1,73 @@
+"""Measure how long importing the app takes and which heavy modules it loads.
+
+Usage:
+    python -m benchmarks.import_time [--mode auth|full] [--repeats N] [--max-seconds S]
+
+Every run imports app.py in a fresh interpreter with the given
+DEPLOYMENT_MODE and reports the median wall time and the peak RSS as JSON.
+The exit code is 1 when the median exceeds --max-seconds or, in auth mode,
+when any module of the ML stack was imported, so the script can guard
+against regressions in CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# Modules an auth-only worker must never import
+HEAVY_MODULES = ("tensorflow", "keras", "deepface", "cv2", "mtcnn", "retinaface")
+
+PROBE = f"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_modules": sorted(
+        name for name in {HEAVY_MODULES!r} if name in sys.modules
+    ),
+}}))
+"""
+
+
+def import_once(mode: str) -> dict:
+    environment = dict(os.environ, DEPLOYMENT_MODE=mode)
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(mode: str, repeats: int) -> dict:
+    runs = [import_once(mode) for _ in range(repeats)]
+    return {
+        "mode": mode,
+        "repeats": repeats,
+        "median_seconds": float(np.median([run["seconds"] for run in runs])),
+        "max_rss_kb": max(run["max_rss_kb"] for run in runs),
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", default="auth", choices=("auth", "full"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+    report = run(args.mode, args.repeats)
+    print(json.dumps(report, indent=2))
+
+    failed = args.max_seconds is not None and report["median_seconds"] > args.max_seconds
+    if args.mode == "auth" and report["heavy_modules"]:
+        failed = True
+    sys.exit(1 if failed else 0)
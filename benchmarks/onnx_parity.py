@@ -0,0 +1,84 @@
+"""Check the ONNX export of the embedding model against the Keras model.
+
+Usage:
+    python -m benchmarks.onnx_parity [--faces N] [--batch-size N] [--tolerance T]
+
+Embeds the same synthetic faces with both backends and reports the largest
+absolute difference, the lowest cosine similarity between the two
+embeddings of a face, the per-frame latency of each backend and the RSS
+after each model was built. The exit code is 1 when any face has a cosine
+similarity below 1 - tolerance, so the check can gate an export.
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+
+import numpy as np
+
+from face_authentication.inference.model_registry import ModelRegistry
+
+
+def max_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def embed(model, faces: np.ndarray, batch_size: int) -> tuple:
+    """Embeddings of the faces and the seconds per frame, after one warm up"""
+    model.predict_on_batch(faces[:batch_size])
+    start = time.perf_counter()
+    embeddings = np.concatenate(
+        [
+            np.asarray(model.predict_on_batch(faces[i : i + batch_size]), dtype=np.float32)
+            for i in range(0, len(faces), batch_size)
+        ]
+    )
+    return embeddings, (time.perf_counter() - start) / len(faces)
+
+
+def run(faces: int, batch_size: int) -> dict:
+    rss_start = max_rss_kb()
+    # ONNX first, so its footprint is measured before TensorFlow is imported
+    start = time.perf_counter()
+    onnx_model = ModelRegistry.build_embedding_model("onnx")
+    onnx_load_seconds = time.perf_counter() - start
+    rss_onnx = max_rss_kb()
+    start = time.perf_counter()
+    keras_model = ModelRegistry.build_embedding_model("keras")
+    keras_load_seconds = time.perf_counter() - start
+    rss_keras = max_rss_kb()
+
+    _, height, width, _ = keras_model.input_shape
+    inputs = (
+        np.random.default_rng(0).random((faces, height, width, 3)).astype(np.float32)
+    )
+    keras_embeddings, keras_seconds = embed(keras_model, inputs, batch_size)
+    onnx_embeddings, onnx_seconds = embed(onnx_model, inputs, batch_size)
+
+    cosine = np.sum(keras_embeddings * onnx_embeddings, axis=1) / (
+        np.linalg.norm(keras_embeddings, axis=1) * np.linalg.norm(onnx_embeddings, axis=1)
+    )
+    return {
+        "faces": faces,
+        "batch_size": batch_size,
+        "max_abs_difference": float(np.abs(keras_embeddings - onnx_embeddings).max()),
+        "min_cosine_similarity": float(cosine.min()),
+        "keras_ms_per_frame": 1000 * keras_seconds,
+        "onnx_ms_per_frame": 1000 * onnx_seconds,
+        "keras_load_seconds": keras_load_seconds,
+        "onnx_load_seconds": onnx_load_seconds,
+        "onnx_rss_increase_kb": rss_onnx - rss_start,
+        "keras_rss_increase_kb": rss_keras - rss_onnx,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faces", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    args = parser.parse_args()
+    report = run(args.faces, args.batch_size)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["min_cosine_similarity"] >= 1 - args.tolerance else 1)
@@ -0,0 +1,339 @@
+"""Stage level benchmark of the face authentication pipeline.
+
+Usage:
+    python -m benchmarks.pipeline [--output results.json] [--repeats N] [--skip-models]
+        [--face-image PATH]
+
+Runs offline on CPU with Mongo replaced by an in-memory collection. Image
+decode, face detection, embedding, average_embedding, cosine_simmilarity and
+the embedding data access are timed separately across image sizes, frame
+counts and batch sizes. For every case the p50/p95/p99 latency, the
+throughput and the peak resident set size of the process are written as JSON
+so that runs can be compared over time. The model stages expect the weights
+to already be in MODEL_CACHE_DIRECTORY.
+
+The images are drawn synthetically unless --face-image gives a photo of a
+real face, which is scaled to every image size. The detectors may not find a
+face in the drawings, so the detect stages report their success rate and the
+detection timings of a synthetic run are only comparable to each other.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# The data access layer reads its settings at import time
+for variable, value in {
+    "MONGODB_URL": "mongodb://localhost:27017",
+    "DATABASE_NAME": "benchmark",
+    "USER_COLLECTION_NAME": "users",
+    "USER_EMBEDDING_COLLECTION_NAME": "embeddings",
+    # Only the in-process embedding cache, which the benchmark clears itself
+    "EMBEDDING_CACHE_SHARED_DIRECTORY": "",
+}.items():
+    os.environ.setdefault(variable, value)
+
+from face_authentication.constants.embeddings import EMBEDDING_SIZE  # noqa: E402
+from face_authentication.data_access.user_embedding_data import (  # noqa: E402
+    UserEmbeddingData,
+)
+from face_authentication.inference.detector import DetectorCascade  # noqa: E402
+from face_authentication.inference.embedding_cache import EmbeddingCache  # noqa: E402
+from face_authentication.inference.model_registry import ModelRegistry  # noqa: E402
+from face_authentication.inference.preprocessing import decode_image  # noqa: E402
+from face_authentication.validation.user_embedding import (  # noqa: E402
+    UserLoginEmbeddingValidation,
+)
+
+IMAGE_SIDES = (640, 1920, 4000)
+FRAME_COUNTS = (1, 3, 5)
+BATCH_SIZES = (1, 8, 32)
+
+
+class InMemoryCollection:
+    """The subset of a pymongo collection used by UserEmbeddingData"""
+
+    def __init__(self) -> None:
+        self.documents = {}
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False) -> None:
+        document = self.documents.get(query["user_id"])
+        if document is None:
+            if not upsert:
+                return
+            document = self.documents[query["user_id"]] = dict(query)
+        document.update(update.get("$set", {}))
+        for field in update.get("$currentDate", {}):
+            document[field] = datetime.utcnow()
+        for field, amount in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + amount
+        for field in update.get("$unset", {}):
+            document.pop(field, None)
+
+    def find_one(self, query: dict):
+        return self.documents.get(query["user_id"])
+
+
+def current_rss() -> int:
+    """Resident set size of the process in bytes"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRss:
+    """Samples the resident set size while the with block runs.
+
+    Unlike tracemalloc this sees the buffers of TensorFlow, OpenCV and
+    other native libraries. Where /proc is missing the high water mark of
+    the whole process is reported instead.
+    """
+
+    INTERVAL = 0.001
+
+    def __init__(self) -> None:
+        self.peak = 0
+        self.start = 0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self.done.is_set():
+            self.peak = max(self.peak, current_rss())
+            self.done.wait(PeakRss.INTERVAL)
+
+    def __enter__(self) -> "PeakRss":
+        if os.path.exists("/proc/self/statm"):
+            self.start = self.peak = current_rss()
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.thread.is_alive():
+            self.done.set()
+            self.thread.join()
+            self.peak = max(self.peak, current_rss())
+        else:
+            import resource
+
+            # Kilobytes on Linux
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(latencies: list, items: int, rss: PeakRss) -> dict:
+    latencies = np.asarray(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "p50_ms": 1000 * p50,
+        "p95_ms": 1000 * p95,
+        "p99_ms": 1000 * p99,
+        "throughput_per_second": items * len(latencies) / latencies.sum(),
+        "peak_rss_bytes": rss.peak,
+        "rss_growth_bytes": rss.peak - rss.start if rss.start else None,
+    }
+
+
+def measure(func, repeats: int, items: int = 1) -> dict:
+    """Time func over repeats runs after one warm up call"""
+    func()
+    latencies = []
+    with PeakRss() as rss:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+    return summarize(latencies, items, rss)
+
+
+def synthetic_face(side: int, seed: int = 0) -> bytes:
+    """JPEG of a face-like drawing whose longest side is side pixels"""
+    rng = np.random.default_rng(seed)
+    width, height = side, side * 3 // 4
+    pixels = rng.integers(90, 160, size=(height, width, 3), dtype=np.uint8)
+    img = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(img)
+    cx, cy, r = width // 2, height // 2, height // 4
+    draw.ellipse((cx - r, cy - int(1.3 * r), cx + r, cy + int(1.3 * r)), fill=(224, 172, 140))
+    for dx in (-r // 2, r // 2):
+        draw.ellipse((cx + dx - r // 8, cy - r // 3, cx + dx + r // 8, cy - r // 6), fill=(40, 30, 30))
+    draw.rectangle((cx - r // 3, cy + r // 2, cx + r // 3, cy + r // 2 + r // 10), fill=(150, 60, 60))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def photo(path: str, side: int, seed: int = 0) -> bytes:
+    """JPEG of a photo scaled so that its longest side is side pixels. The
+    seed changes the JPEG quality, so every frame has other bytes."""
+    img = Image.open(path).convert("RGB")
+    scale = side / max(img.size)
+    img = img.resize((round(img.width * scale), round(img.height * scale)))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90 - seed)
+    return buffer.getvalue()
+
+
+def face_image(side: int, seed: int = 0, path: str = None) -> bytes:
+    if path is None:
+        return synthetic_face(side, seed)
+    return photo(path, side, seed)
+
+
+def detection_rates(cascade: DetectorCascade) -> dict:
+    """Share of the images in which the cascade found a face, overall and by
+    every backend"""
+    stats = cascade.stats()
+    images = stats["stages"][cascade.backends[0]]["runs"]
+    return {
+        "detection_success_rate": 1 - stats["misses"] / images if images else None,
+        "detector_hit_rates": {
+            backend: counters["hits"] / images if images else None
+            for backend, counters in stats["stages"].items()
+        },
+    }
+
+
+def benchmark_decode(repeats: int, path: str = None) -> list:
+    results = []
+    for side in IMAGE_SIDES:
+        contents = face_image(side, path=path)
+        result = measure(lambda: decode_image(contents), repeats)
+        results.append({"stage": "decode", "image_side": side, **result})
+    return results
+
+
+def benchmark_models(repeats: int, path: str = None) -> list:
+    ModelRegistry().load()
+    results = []
+    for side in IMAGE_SIDES:
+        img_array = decode_image(face_image(side, path=path))
+        cascade = DetectorCascade()
+
+        def detect():
+            try:
+                # Including the second detection inside the crop
+                DetectorCascade.redetect(cascade.detect(img_array))
+            except ValueError:
+                # No face, with ENFORCE_DETECTION on. Counted as a miss.
+                pass
+
+        result = measure(detect, repeats)
+        results.append(
+            {"stage": "detect", "image_side": side, **result, **detection_rates(cascade)}
+        )
+
+    face = UserLoginEmbeddingValidation.extract_face(
+        decode_image(face_image(640, path=path))
+    )
+    for batch_size in BATCH_SIZES:
+        faces = np.repeat(face, batch_size, axis=0)
+        result = measure(lambda: ModelRegistry.embed(faces), repeats, batch_size)
+        results.append({"stage": "embed", "batch_size": batch_size, **result})
+
+    cache = EmbeddingCache.get_cache()
+
+    def embed_uncached(files):
+        cache.memory.clear()
+        return UserLoginEmbeddingValidation.generate_embedding_list(files)
+
+    for frames in FRAME_COUNTS:
+        files = [face_image(1920, seed, path) for seed in range(frames)]
+        result = measure(lambda: embed_uncached(files), repeats, frames)
+        results.append({"stage": "end_to_end", "frames": frames, **result})
+        # Exact repeats of the same frames, as sent by retrying clients
+        result = measure(
+            lambda: UserLoginEmbeddingValidation.generate_embedding_list(files),
+            repeats,
+            frames,
+        )
+        results.append({"stage": "end_to_end_cached", "frames": frames, **result})
+    return results
+
+
+def benchmark_math(repeats: int) -> list:
+    rng = np.random.default_rng(0)
+    results = []
+    stored = rng.standard_normal(EMBEDDING_SIZE).astype(np.float32)
+    stored /= np.linalg.norm(stored)
+    for frames in FRAME_COUNTS:
+        embeddings = rng.standard_normal((frames, EMBEDDING_SIZE)).astype(np.float32)
+        result = measure(
+            lambda: UserLoginEmbeddingValidation.average_embedding(embeddings), repeats
+        )
+        results.append({"stage": "average_embedding", "frames": frames, **result})
+    current = embeddings.mean(axis=0)
+    result = measure(
+        lambda: UserLoginEmbeddingValidation.cosine_simmilarity(
+            stored, current, normalized=True
+        ),
+        repeats,
+    )
+    results.append({"stage": "cosine_simmilarity", **result})
+    return results
+
+
+def benchmark_data_access(repeats: int) -> list:
+    user_embedding_data = UserEmbeddingData.__new__(UserEmbeddingData)
+    user_embedding_data.collection = InMemoryCollection()
+    embedding = np.random.default_rng(0).standard_normal(EMBEDDING_SIZE)
+    results = [
+        {
+            "stage": "save_user_embedding",
+            **measure(
+                lambda: user_embedding_data.save_user_embedding("user", embedding),
+                repeats,
+            ),
+        }
+    ]
+
+    def read_uncached():
+        UserEmbeddingData.cache.invalidate("user")
+        user_embedding_data.get_normalized_embedding("user")
+
+    results.append({"stage": "get_embedding_uncached", **measure(read_uncached, repeats)})
+    results.append(
+        {
+            "stage": "get_embedding_cached",
+            **measure(
+                lambda: user_embedding_data.get_normalized_embedding("user"), repeats
+            ),
+        }
+    )
+    return results
+
+
+def run(repeats: int, skip_models: bool, path: str = None) -> dict:
+    results = benchmark_decode(repeats, path)
+    if not skip_models:
+        results += benchmark_models(repeats, path)
+    results += benchmark_math(repeats)
+    results += benchmark_data_access(repeats)
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeats": repeats,
+        "images": path or "synthetic",
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--skip-models", action="store_true")
+    parser.add_argument("--face-image")
+    args = parser.parse_args()
+    report = run(args.repeats, args.skip_models, args.face_image)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
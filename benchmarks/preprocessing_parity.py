@@ -0,0 +1,116 @@
+"""Check that the batched preprocessing reproduces DeepFace.represent.
+
+Usage:
+    python -m benchmarks.preprocessing_parity SOURCE [--output results.json]
+
+SOURCE is a directory or manifest of real face photos in the layout of
+face_authentication.inference.bulk_enroll, a few images per user. Every
+image is embedded twice: the way the stored enrolments were embedded, by
+detecting the face with DETECTOR and passing the crop to DeepFace.represent,
+and the way the application does now. For every user with at least two
+images the other images are enrolled the old way and the last one is scored
+against that enrolment through both paths, which is what an existing user
+sees at login.
+
+Reports the cosine similarity between the two embeddings of an image, how
+far the login scores move and how many accept or reject decisions at
+SIMILARITY_THRESHOLD change. The exit code is 1 when any decision changes,
+in which case the preprocessing no longer matches EMBEDDING_PIPELINE_VERSION.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# Sets the database settings the data access layer reads at import time
+import benchmarks.pipeline  # noqa: F401
+from face_authentication.constants.embeddings import (
+    DETECTOR,
+    EMBEDDING_MODEL_NAME,
+    SIMILARITY_THRESHOLD,
+)
+from face_authentication.inference.bulk_enroll import read_source
+from face_authentication.inference.model_registry import ModelRegistry
+from face_authentication.inference.preprocessing import decode_image
+from face_authentication.validation.user_embedding import (
+    UserLoginEmbeddingValidation,
+)
+
+
+def legacy_embedding(img_array: np.ndarray) -> np.ndarray:
+    """Embedding the way DeepFace.represent computed it for the enrolments"""
+    ModelRegistry.prepare_model_directory()
+    from deepface import DeepFace
+    from deepface.commons.functions import detect_face
+
+    faces = detect_face(img_array, detector_backend=DETECTOR, enforce_detection=False)
+    return np.asarray(
+        DeepFace.represent(
+            img_path=faces[0],
+            model_name=EMBEDDING_MODEL_NAME,
+            model=ModelRegistry.get_embedding_model(),
+            enforce_detection=False,
+        ),
+        dtype=np.float32,
+    )
+
+
+def current_embedding(img_array: np.ndarray) -> np.ndarray:
+    """Embedding of the batched path of the application"""
+    face = UserLoginEmbeddingValidation.extract_face(img_array)
+    return ModelRegistry.embed(face)[0]
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def run(source: str) -> dict:
+    ModelRegistry().load()
+    image_cosines, score_shifts, changed, users = [], [], 0, 0
+    for user_id, paths in read_source(source).items():
+        legacy, current = [], []
+        for path in paths:
+            with open(path, "rb") as image:
+                img_array = decode_image(image.read())
+            legacy.append(legacy_embedding(img_array))
+            current.append(current_embedding(img_array))
+            image_cosines.append(cosine(legacy[-1], current[-1]))
+        if len(paths) < 2:
+            continue
+        users += 1
+        enrolment = np.mean(legacy[:-1], axis=0)
+        legacy_score = cosine(enrolment, legacy[-1])
+        current_score = cosine(enrolment, current[-1])
+        score_shifts.append(current_score - legacy_score)
+        if (legacy_score >= SIMILARITY_THRESHOLD) != (
+            current_score >= SIMILARITY_THRESHOLD
+        ):
+            changed += 1
+    image_cosines = np.asarray(image_cosines)
+    score_shifts = np.asarray(score_shifts)
+    return {
+        "images": len(image_cosines),
+        "users": users,
+        "min_image_cosine": float(image_cosines.min()),
+        "p5_image_cosine": float(np.percentile(image_cosines, 5)),
+        "median_image_cosine": float(np.median(image_cosines)),
+        "mean_score_shift": float(score_shifts.mean()) if users else None,
+        "max_score_drop": float(-score_shifts.min()) if users else None,
+        "decisions_changed": changed,
+        "threshold": SIMILARITY_THRESHOLD,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    report = run(args.source)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    sys.exit(1 if report["decisions_changed"] else 0)
@@ -1,15 +1,27 @@
+import asyncio
 import os
+from collections import deque
 from typing import List
 
-from fastapi import APIRouter, File, Request
+from fastapi import APIRouter, Request
 from starlette import status
 from starlette.responses import JSONResponse, RedirectResponse
 
-from controller.auth_controller.authentication import get_current_user
-from face_authentication.validation.user_embedding import (
-    UserLoginEmbeddingValidation,
-    UserRegisterEmbeddingValidation,
+from controller.app_controller.upload import MultipartStream, UploadTooLarge
+from controller.auth_controller.authentication import (
+    get_current_user,
+    is_identification_client,
 )
+from face_authentication.config.database import MongodbClient
+from face_authentication.constants.embeddings import (
+    EARLY_EXIT_VERIFICATION,
+    IDENTIFICATION_TOP_K,
+)
+from face_authentication.inference import tasks
+from face_authentication.inference.embedding_cache import UploadedFace
+from face_authentication.inference.executor import InferenceExecutor
+from face_authentication.inference.preprocessing import InvalidFaceCrop
+from face_authentication.validation.user_embedding import UserLoginEmbeddingValidation
 
 router = APIRouter(
     prefix="/application",
@@ -20,15 +32,122 @@ router = APIRouter(
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
 
+def is_pre_cropped(request: Request) -> bool:
+    """Clients that detect and align the faces on device send
+    ?pre_cropped=true. A query parameter rather than a form field, because
+    the files go to the workers while the rest of the body is still arriving."""
+    return request.query_params.get("pre_cropped", "false").lower() == "true"
+
+
+async def extract_uploaded_faces(
+    stream: MultipartStream, pre_cropped: bool = False
+) -> List[UploadedFace]:
+    """Start face extraction of every uploaded file as soon as it has arrived,
+    so that receiving the rest of the body overlaps with the detection
+    Args:
+        stream (MultipartStream): Body of the request
+        pre_cropped (bool): The files are aligned face crops of the model
+            input size, so detection is skipped
+    Returns:
+        List[UploadedFace]: Faces of the uploaded files, in upload order
+    """
+    executor = InferenceExecutor()
+    extract = tasks.extract_precropped_face if pre_cropped else tasks.extract_face
+    files = stream.files()
+    pending = []
+    try:
+        async for _, contents in files:
+            # A file that already failed fails the request, stop receiving
+            for future in pending:
+                if future.done():
+                    future.result()
+            pending.append(asyncio.ensure_future(executor.run(extract, contents)))
+        if not pending:
+            raise ValueError("No files uploaded")
+        return list(await asyncio.gather(*pending))
+    finally:
+        # Only left running when an extraction or the upload failed
+        for future in pending:
+            future.cancel()
+        await files.aclose()
+
+
+async def verify_uploaded_faces(
+    user_id: str, stream: MultipartStream, pre_cropped: bool = False
+) -> dict:
+    """Verify the uploaded frames in upload order and stop once the decision
+    is certain. Only as many frames as there are inference workers are being
+    extracted at a time, and the frames already extracted when the previous
+    batch is done are embedded together in one batch. Frames still in flight
+    at the decision are cancelled and the rest are never extracted.
+    Args:
+        user_id (str): User logging in
+        stream (MultipartStream): Body of the request
+        pre_cropped (bool): The files are aligned face crops of the model
+            input size, so detection is skipped
+    Returns:
+        dict: status of the login and the number of frames processed
+    """
+    # The constructor reads the templates of the user
+    validation = await MongodbClient.run(UserLoginEmbeddingValidation, user_id)
+    if not validation.user:
+        return {"status": False, "frames_processed": 0}
+    executor = InferenceExecutor()
+    extract = tasks.extract_precropped_face if pre_cropped else tasks.extract_face
+    files = stream.files()
+    pending = deque()
+    more_files = True
+    simmilarity = None
+    try:
+        while True:
+            while more_files and len(pending) < executor.workers:
+                try:
+                    _, contents = await files.__anext__()
+                except StopAsyncIteration:
+                    more_files = False
+                    break
+                pending.append(asyncio.ensure_future(executor.run(extract, contents)))
+            if not pending:
+                break
+            faces = [await pending.popleft()]
+            while pending and pending[0].done():
+                faces.append(pending.popleft().result())
+            embeddings = await executor.run(tasks.embed_faces, faces)
+            simmilarity = validation.add_embeddings(embeddings)
+            if validation.is_certain(simmilarity):
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        await files.aclose()
+    if simmilarity is None:
+        raise ValueError("No files uploaded")
+    # Accepting may write the updated templates of the user
+    status = await MongodbClient.run(validation.decide, simmilarity)
+    return {"status": status, "frames_processed": validation.frames_processed}
+
+
+def upload_too_large_response() -> JSONResponse:
+    msg = "Uploaded files are too large"
+    return JSONResponse(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        content={"status": False, "message": msg},
+    )
+
+
+def invalid_face_crop_response(error: InvalidFaceCrop) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"status": False, "message": str(error)},
+    )
+
+
 @router.post("/")
-async def login_embedding(
-    request: Request,
-    files: List[bytes] = File(description="Multiple files as UploadFile"),
-):
+async def login_embedding(request: Request):
     """This function is used to get the embedding of the user while login
     Args:
-        request (Request): _description_
-        files (List[UploadFile], optional): _description_. Defaults to \File(description="Multiple files as UploadFile").
+        request (Request): multipart/form-data request with the images as files,
+            with ?pre_cropped=true when they are aligned face crops
     Returns:
         response: If user is authenticated then it returns the response
     """
@@ -38,25 +157,47 @@ async def login_embedding(
         if user is None:
             return RedirectResponse(url="/auth", status_code=status.HTTP_302_FOUND)
 
-        user_embedding_validation = UserLoginEmbeddingValidation(user['user']["user_id"])
+        user_id = user['user']["user_id"]
+        stream = MultipartStream(request)
+        if EARLY_EXIT_VERIFICATION:
+            result = await verify_uploaded_faces(
+                user_id, stream, is_pre_cropped(request)
+            )
+        else:
+            faces = await extract_uploaded_faces(stream, is_pre_cropped(request))
 
-        # Compare embedding
-        user_simmilariy_status = user_embedding_validation.compare_embedding(files)
+            # Compare embedding
+            result = await InferenceExecutor().run(tasks.compare_faces, user_id, faces)
+        user_simmilariy_status = result["status"]
+        frames_processed = result["frames_processed"]
         print("user_embedding_validation",user_simmilariy_status)
 
         if user_simmilariy_status:
             msg = "User is authenticated"
             response = JSONResponse(
-                status_code=status.HTTP_200_OK, content={"status": True, "message": msg}
+                status_code=status.HTTP_200_OK,
+                content={
+                    "status": True,
+                    "message": msg,
+                    "frames_processed": frames_processed,
+                },
             )
             return response
         else:
             msg = "User is not authenticated"
             response = JSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"status": False, "message": msg},
+                content={
+                    "status": False,
+                    "message": msg,
+                    "frames_processed": frames_processed,
+                },
             )
             return response
+    except UploadTooLarge:
+        return upload_too_large_response()
+    except InvalidFaceCrop as e:
+        return invalid_face_crop_response(e)
     except Exception as e:
         msg = "Error in Login Embedding in Database"
         response = JSONResponse(
@@ -67,14 +208,11 @@ async def login_embedding(
 
 
 @router.post("/register_embedding")
-async def register_embedding(
-    request: Request,
-    files: List[bytes] = File(description="Multiple files as UploadFile"),
-):
+async def register_embedding(request: Request):
     """This function is used to get the embedding of the user while register
     Args:
-        request (Request): _description_
-        files (List[UploadFile], optional): _description_. Defaults to \File(description="Multiple files as UploadFile").
+        request (Request): multipart/form-data request with the images as files,
+            with ?pre_cropped=true when they are aligned face crops
     Returns:
         Response: If user is registered then it returns the response
     """
@@ -84,10 +222,12 @@ async def register_embedding(
         uuid = request.session.get("uuid")
         if uuid is None:
             return RedirectResponse(url="/auth", status_code=status.HTTP_302_FOUND)
-        user_embedding_validation = UserRegisterEmbeddingValidation(uuid)
+        faces = await extract_uploaded_faces(
+            MultipartStream(request), is_pre_cropped(request)
+        )
 
         # Save the embeddings
-        user_embedding_validation.save_embedding(files)
+        await InferenceExecutor().run(tasks.save_faces, uuid, faces)
 
         msg = "Embedding Stored Successfully in Database"
         response = JSONResponse(
@@ -96,10 +236,72 @@ async def register_embedding(
             headers={"uuid": uuid},
         )
         return response
+    except UploadTooLarge:
+        return upload_too_large_response()
+    except InvalidFaceCrop as e:
+        return invalid_face_crop_response(e)
     except Exception as e:
         msg = "Error in Storing Embedding in Database"
         response = JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={"status": True, "message": msg},
         )
-        return response
\ No newline at end of file
+        return response
+
+
+@router.post("/identify")
+async def identify_user(request: Request):
+    """This function is used to find which enrolled users match the images
+    Args:
+        request (Request): multipart/form-data request of a kiosk or service
+            with an X-API-Key header, the images as files and an optional top_k
+            field, the maximum number of matches up to IDENTIFICATION_TOP_K,
+            with ?pre_cropped=true when they are aligned face crops
+    Returns:
+        Response: The matching users, best match first
+    """
+
+    try:
+        # Checked before the body is read, the images of an unauthorized
+        # client are never decoded
+        if not is_identification_client(request):
+            msg = "Not Authorized!!!"
+            return JSONResponse(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                content={"status": False, "message": msg},
+            )
+
+        stream = MultipartStream(request)
+        faces = await extract_uploaded_faces(stream, is_pre_cropped(request))
+        try:
+            top_k = int(stream.fields.get("top_k", IDENTIFICATION_TOP_K))
+        except ValueError:
+            msg = "top_k must be an integer"
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                content={"status": False, "message": msg},
+            )
+        top_k = min(max(top_k, 1), IDENTIFICATION_TOP_K)
+        matches = await InferenceExecutor().run(tasks.identify, faces, top_k)
+        if not matches:
+            msg = "No matching user found"
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content={"status": False, "message": msg, "matches": []},
+            )
+        msg = "User identified"
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={"status": True, "message": msg, "matches": matches},
+        )
+    except UploadTooLarge:
+        return upload_too_large_response()
+    except InvalidFaceCrop as e:
+        return invalid_face_crop_response(e)
+    except Exception as e:
+        msg = "Error in Identifying User"
+        response = JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"status": False, "message": msg},
+        )
+        return response
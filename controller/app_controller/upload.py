@@ -0,0 +1,106 @@
+from collections import deque
+from typing import AsyncIterator, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from face_authentication.constants.server import (
+    MAX_UPLOAD_FILE_SIZE,
+    MAX_UPLOAD_REQUEST_SIZE,
+)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MultipartStream:
+    """Parses a multipart/form-data body while it is being received.
+
+    Every uploaded file is handed out as soon as its last byte arrived, so the
+    caller can start processing it while the rest of the body is still on the
+    wire. Plain form fields are collected into ``fields``.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        max_file_size: int = MAX_UPLOAD_FILE_SIZE,
+        max_request_size: int = MAX_UPLOAD_REQUEST_SIZE,
+    ) -> None:
+        self.request = request
+        self.max_file_size = max_file_size
+        self.max_request_size = max_request_size
+        self.fields = {}
+        self.completed = deque()
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.data = bytearray()
+
+    async def files(self) -> AsyncIterator[Tuple[str, bytes]]:
+        """Yield (field name, contents) of every uploaded file in order
+        Raises:
+            UploadTooLarge: As soon as a limit is exceeded
+        """
+        # Refuse before reading anything when the client announces the size
+        content_length = self.request.headers.get("content-length")
+        if content_length is not None and int(content_length) > self.max_request_size:
+            raise UploadTooLarge("Request body is too large")
+
+        _, params = parse_options_header(self.request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if boundary is None:
+            raise ValueError("Request is not multipart/form-data")
+
+        parser = MultipartParser(
+            boundary,
+            callbacks={
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+            },
+        )
+        received = 0
+        async for chunk in self.request.stream():
+            received += len(chunk)
+            if received > self.max_request_size:
+                raise UploadTooLarge("Request body is too large")
+            parser.write(chunk)
+            while self.completed:
+                yield self.completed.popleft()
+        parser.finalize()
+        while self.completed:
+            yield self.completed.popleft()
+
+    def _on_part_begin(self) -> None:
+        self.headers = {}
+        self.data = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.data += data[start:end]
+        if len(self.data) > self.max_file_size:
+            raise UploadTooLarge("Uploaded file is too large")
+
+    def _on_part_end(self) -> None:
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        if b"filename" in options:
+            self.completed.append((name, bytes(self.data)))
+        else:
+            self.fields[name] = self.data.decode("utf-8")
+        self.data = bytearray()
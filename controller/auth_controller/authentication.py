@@ -1,17 +1,15 @@
-from datetime import datetime, timedelta
-import string
-import random
+import hmac
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Request, Response, status
-from jose import JWTError, jwt
 from pydantic import BaseModel
-from starlette.responses import JSONResponse, RedirectResponse
+from starlette.responses import JSONResponse
 
+from face_authentication.constants.auth import IDENTIFICATION_API_KEYS
+from face_authentication.validation.password import PasswordHashingBusy
+from face_authentication.validation.session import SessionValidation
 from face_authentication.validation.user import LoginValidation, RegisterValidation
-from face_authentication.constants.auth import ALGORITHM, SECRET_KEY
 from face_authentication.entity.user import User
-from face_authentication.data_access.user_data import UserData
 
 
 class Login(BaseModel):
@@ -44,6 +42,14 @@ router = APIRouter(
 # Calling the logger for Database read and insert operations
 
 
+def password_hashing_busy_response() -> JSONResponse:
+    msg = "Server is busy, please try again"
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": False, "message": msg},
+    )
+
+
 async def get_current_user(request: Request):
     """This function is used to get the current user
     Args:
@@ -52,23 +58,17 @@ async def get_current_user(request: Request):
         dict: Returns the username and uuid of the user
     """
     try:
-        # secret_key = SECRET_KEY
-        # algorithm = ALGORITHM
-
-        email = request.cookies.get("email_id")
-        if email is None:
+        token = request.cookies.get("access_token")
+        if token is None:
             return None
 
-        userdata = UserData()
-        payload = userdata.get_user({"email_id": email})
-
-        user = {"username":payload["username"], "user_id":payload["uuid"]}
+        # Verified locally, the revocation list is read at most every few seconds
+        payload = await SessionValidation.verify_token(token)
+        if payload is None:
+            return None
 
-        if user is None:
-            return logout(request)
+        user = {"username":payload["username"], "user_id":payload["user_id"]}
         return {"user": user}
-    except JWTError:
-        raise HTTPException(status_code=404, detail="Detail Not Found")
     except Exception as e:
         msg = "Error while getting current user"
         response = JSONResponse(
@@ -77,11 +77,22 @@ async def get_current_user(request: Request):
         return response
 
 
-def create_access_token() -> str:
-    """This function is used to create the access token"""
+def is_identification_client(request: Request) -> bool:
+    """Check the X-API-Key header of a kiosk or service calling the
+    identification route against the configured keys, in constant time"""
+    key = request.headers.get("x-api-key")
+    if not key:
+        return False
+    return any(
+        hmac.compare_digest(key.encode(), allowed.encode())
+        for allowed in IDENTIFICATION_API_KEYS
+    )
+
+
+def create_access_token(user: dict) -> str:
+    """This function is used to create the signed access token of the user"""
     try:
-        res = ''.join(random.choices(string.ascii_letters, k=16))
-        return str(res)
+        return SessionValidation.create_token(user["uuid"], user["username"])
     except Exception as e:
         raise e
 
@@ -95,13 +106,14 @@ async def login_for_access_token(response: Response, login) -> dict:
 
     try:
         user_validation = LoginValidation(login.email_id, login.password)
-        user: Optional[str] = user_validation.authenticate_user_login()
+        user: Optional[str] = await user_validation.authenticate_user_login()
         if not user:
             return {"status": False, "uuid": None, "response": response}
-        token = create_access_token()
+        token = create_access_token(user)
         response.set_cookie(key="access_token", value=token, httponly=True)
-        response.set_cookie(key="email_id", value=login.email_id, httponly=True)
         return {"status": True, "uuid": user["uuid"], "response": response}
+    except PasswordHashingBusy:
+        raise
     except Exception as e:
         msg = "Failed to set access token"
         response = JSONResponse(
@@ -147,6 +159,9 @@ async def login(request: Request, login: Login):
 
         return response
 
+    except PasswordHashingBusy:
+        return password_hashing_busy_response()
+
     except HTTPException:
         msg = "UnKnown Error"
         return JSONResponse(
@@ -207,7 +222,7 @@ async def register_user(request: Request, register: Register):
         # Validation of the user input data to check the format of the data
         user_registration = RegisterValidation(user)
 
-        validate_regitration = user_registration.validate_registration()
+        validate_regitration = await user_registration.validate_registration()
         if not validate_regitration["status"]:
             msg = validate_regitration["msg"]
             response = JSONResponse(
@@ -217,7 +232,14 @@ async def register_user(request: Request, register: Register):
             return response
 
         # Save user if the validation is successful
-        validation_status = user_registration.authenticate_user_registration()
+        validation_status = await user_registration.authenticate_user_registration()
+        if not validation_status["status"]:
+            # Another registration with the same details won the race
+            response = JSONResponse(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                content={"status": False, "message": validation_status["msg"]},
+            )
+            return response
 
         msg = "Registration Successful...Please Login to continue"
         response = JSONResponse(
@@ -226,6 +248,8 @@ async def register_user(request: Request, register: Register):
             headers={"uuid": user.uuid_},
         )
         return response
+    except PasswordHashingBusy:
+        return password_hashing_busy_response()
     except Exception as e:
         raise e
 
@@ -238,11 +262,13 @@ async def logout(request: Request):
     """
     try:
         msg = "You have been logged out"
-        response =  RedirectResponse(url="/auth/", status_code=status.HTTP_302_FOUND, headers={"msg": msg})
-        response.delete_cookie(key="access_token")
+        token = request.cookies.get("access_token")
+        if token is not None:
+            await SessionValidation.revoke_token(token)
         response = JSONResponse(
             status_code=status.HTTP_200_OK, content={"status": True, "message": msg}
         )
+        response.delete_cookie(key="access_token")
         return response
     except Exception as e:
         raise e
\ No newline at end of file
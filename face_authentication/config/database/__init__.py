@@ -1,21 +1,84 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import pymongo
+from pymongo.errors import OperationFailure
 
+from face_authentication.config.database.metrics import MongoMetrics
 from face_authentication.constants.database import (
     DATABASE_NAME,
-    MONGODB_URL
+    MONGODB_CONNECT_TIMEOUT_MS,
+    MONGODB_MAX_POOL_SIZE,
+    MONGODB_MIN_POOL_SIZE,
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    MONGODB_SOCKET_TIMEOUT_MS,
+    MONGODB_URL,
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS,
 )
+from face_authentication.logger import in_context, logging
 
 
 class MongodbClient:
     client = None
+    # Runs the blocking pymongo calls of the async data access layer
+    executor = None
+    metrics = MongoMetrics()
 
     def __init__(self, database_name=DATABASE_NAME) -> None:
         if MongodbClient.client is None:
-            mongo_db_url = MONGODB_URL
-            if "localhost" in mongo_db_url:
-                MongodbClient.client = pymongo.MongoClient(mongo_db_url) 
-            else:
-                MongodbClient.client=pymongo.MongoClient(mongo_db_url)
+            MongodbClient.client = pymongo.MongoClient(
+                MONGODB_URL,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+                event_listeners=[MongodbClient.metrics],
+            )
         self.client = MongodbClient.client
         self.database = self.client[database_name]
-        self.database_name = database_name
\ No newline at end of file
+        self.database_name = database_name
+
+    @staticmethod
+    async def run(func, *args):
+        """Run a blocking database call without stalling the event loop"""
+        if MongodbClient.executor is None:
+            # More threads than pooled connections would only queue in pymongo
+            MongodbClient.executor = ThreadPoolExecutor(
+                max_workers=MONGODB_MAX_POOL_SIZE, thread_name_prefix="mongodb"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            MongodbClient.executor, in_context(func, *args)
+        )
+
+    @staticmethod
+    def create_indexes() -> None:
+        """Create the indexes every collection relies on. Existing duplicates
+        make index creation fail, which is logged instead of stopping the app."""
+        # Imported here as the data access classes themselves use MongodbClient
+        from face_authentication.data_access.revoked_token_data import (
+            RevokedTokenData,
+        )
+        from face_authentication.data_access.user_data import UserData
+        from face_authentication.data_access.user_embedding_data import (
+            UserEmbeddingData,
+        )
+
+        for data in (UserData(), UserEmbeddingData(), RevokedTokenData()):
+            try:
+                data.create_indexes()
+            except OperationFailure as e:
+                logging.error(
+                    f"Could not create indexes on {data.collection_name}: {e}"
+                )
+
+    @staticmethod
+    def close() -> None:
+        if MongodbClient.executor is not None:
+            MongodbClient.executor.shutdown(wait=True)
+            MongodbClient.executor = None
+        if MongodbClient.client is not None:
+            MongodbClient.client.close()
+            MongodbClient.client = None
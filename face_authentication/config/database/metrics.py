@@ -0,0 +1,76 @@
+import threading
+import time
+
+from pymongo import monitoring
+
+from face_authentication.logger import record_stage
+from face_authentication.metrics import (
+    DB_CHECKOUT_FAILURES,
+    DB_OPERATION_SECONDS,
+    DB_POOL_WAIT_SECONDS,
+)
+
+
+class MongoMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """Records how long operations wait for a pooled connection and how long
+    every command takes on the server round trip"""
+
+    def __init__(self) -> None:
+        # Check out events are published on the thread that waits
+        self.local = threading.local()
+
+    # Connection pool events
+
+    def connection_check_out_started(self, event) -> None:
+        self.local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        started = getattr(self.local, "checkout_started", None)
+        if started is not None:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    def connection_check_out_failed(self, event) -> None:
+        DB_CHECKOUT_FAILURES.inc()
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def connection_checked_in(self, event) -> None:
+        pass
+
+    # Command events
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        self._observe(event)
+
+    def failed(self, event) -> None:
+        self._observe(event)
+
+    @staticmethod
+    def _observe(event) -> None:
+        # Published on the thread that ran the command, which carries the
+        # context of the request
+        seconds = event.duration_micros / 1e6
+        DB_OPERATION_SECONDS.labels(command=event.command_name).observe(seconds)
+        record_stage("db", seconds)
@@ -1,4 +1,38 @@
 from face_authentication.utilities.utilities import CommonUtils
 
 SECRET_KEY = CommonUtils().get_environment_variable("SECRET_KEY")
-ALGORITHM = CommonUtils().get_environment_variable("HASH_ALGORITHM")
\ No newline at end of file
+ALGORITHM = CommonUtils().get_environment_variable("HASH_ALGORITHM")
+
+# Lifetime of the signed session token set at login
+ACCESS_TOKEN_EXPIRE_MINUTES = int(
+    CommonUtils().get_environment_variable("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+)
+# Comma separated keys of the kiosks and services allowed to call
+# /application/identify in the X-API-Key header. Identification is refused
+# while none is set.
+IDENTIFICATION_API_KEYS = [
+    key.strip()
+    for key in CommonUtils()
+    .get_environment_variable("IDENTIFICATION_API_KEYS", "")
+    .split(",")
+    if key.strip()
+]
+# Logged out sessions are stored in Mongo. Every process caches up to this many
+# answers: a revoked token until it expires, a valid one for
+# SESSION_REVOCATION_CHECK_TTL seconds, the longest a logout takes to reach the
+# other workers.
+SESSION_REVOCATION_CACHE_SIZE = 100000
+SESSION_REVOCATION_CHECK_TTL = float(
+    CommonUtils().get_environment_variable("SESSION_REVOCATION_CHECK_TTL", "5")
+)
+
+# bcrypt cost factor. Stored hashes with another cost are rehashed on login.
+BCRYPT_ROUNDS = int(CommonUtils().get_environment_variable("BCRYPT_ROUNDS", "12"))
+# Threads hashing passwords and the number of hash or verify calls allowed to
+# run or queue at once, separate from the face inference workers
+PASSWORD_HASH_WORKERS = int(
+    CommonUtils().get_environment_variable("PASSWORD_HASH_WORKERS", "2")
+)
+PASSWORD_HASH_MAX_PENDING = int(
+    CommonUtils().get_environment_variable("PASSWORD_HASH_MAX_PENDING", "32")
+)
@@ -3,4 +3,35 @@ from face_authentication.utilities.utilities import CommonUtils
 MONGODB_URL = CommonUtils().get_environment_variable("MONGODB_URL")
 DATABASE_NAME = CommonUtils().get_environment_variable("DATABASE_NAME")
 USER_COLLECTION_NAME = CommonUtils().get_environment_variable("USER_COLLECTION_NAME")
-USER_EMBEDDING_COLLECTION_NAME = CommonUtils().get_environment_variable("USER_EMBEDDING_COLLECTION_NAME")
\ No newline at end of file
+USER_EMBEDDING_COLLECTION_NAME = CommonUtils().get_environment_variable("USER_EMBEDDING_COLLECTION_NAME")
+REVOKED_TOKEN_COLLECTION_NAME = CommonUtils().get_environment_variable(
+    "REVOKED_TOKEN_COLLECTION_NAME", "revoked_tokens"
+)
+
+# In-process cache of the enrolled embeddings, keyed by user_id
+USER_EMBEDDING_CACHE_SIZE = int(
+    CommonUtils().get_environment_variable("USER_EMBEDDING_CACHE_SIZE", "10000")
+)
+USER_EMBEDDING_CACHE_TTL = float(
+    CommonUtils().get_environment_variable("USER_EMBEDDING_CACHE_TTL", "300")
+)
+
+# Connection pool shared by every data access object of the process
+MONGODB_MAX_POOL_SIZE = int(
+    CommonUtils().get_environment_variable("MONGODB_MAX_POOL_SIZE", "50")
+)
+MONGODB_MIN_POOL_SIZE = int(
+    CommonUtils().get_environment_variable("MONGODB_MIN_POOL_SIZE", "0")
+)
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(
+    CommonUtils().get_environment_variable("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000")
+)
+MONGODB_CONNECT_TIMEOUT_MS = int(
+    CommonUtils().get_environment_variable("MONGODB_CONNECT_TIMEOUT_MS", "5000")
+)
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(
+    CommonUtils().get_environment_variable("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+MONGODB_SOCKET_TIMEOUT_MS = int(
+    CommonUtils().get_environment_variable("MONGODB_SOCKET_TIMEOUT_MS", "10000")
+)
@@ -1,6 +1,162 @@
+import os
+
+from face_authentication.utilities.utilities import CommonUtils
+
 EMBEDDING_SIZE = 128
 EMBEDDING_TYPE = 1
 SIMILARITY_THRESHOLD = 0.75
 DETECTOR = "mtcnn"
 ENFORCE_DETECTION = False
-EMBEDDING_MODEL_NAME = "Facenet"
\ No newline at end of file
+EMBEDDING_MODEL_NAME = "Facenet"
+
+# Detectors tried in order, each later one only runs when the previous found
+# no usable face. DETECTOR is the accurate but slow last resort.
+DETECTOR_CASCADE = [
+    backend.strip()
+    for backend in CommonUtils()
+    .get_environment_variable("DETECTOR_CASCADE", f"opencv,{DETECTOR}")
+    .split(",")
+]
+# Smallest face, relative to the shorter image side, a cheap detector may
+# return before the next stage is tried. deepface does not expose detection
+# confidences, so tiny boxes stand in for low confidence hits.
+DETECTOR_MIN_FACE_FRACTION = 0.2
+# DeepFace.represent ran this detector once more inside the detected face
+# before resizing it, and every stored enrolment was embedded that way. The
+# batched path does the same so that its embeddings stay comparable.
+REDETECTION_BACKEND = "opencv"
+
+# Directory where deepface keeps the downloaded model weights
+MODEL_CACHE_DIRECTORY = CommonUtils().get_environment_variable(
+    "MODEL_CACHE_DIRECTORY", os.path.join(os.getcwd(), "models")
+)
+# Size of the synthetic image used to warm up the models at startup
+WARMUP_IMAGE_SIZE = 160
+
+# Executor that runs the face inference off the event loop: "thread" or "process"
+INFERENCE_EXECUTOR_KIND = CommonUtils().get_environment_variable(
+    "INFERENCE_EXECUTOR_KIND", "thread"
+)
+INFERENCE_WORKERS = int(
+    CommonUtils().get_environment_variable("INFERENCE_WORKERS", str(os.cpu_count() or 1))
+)
+
+# Micro-batching of faces from concurrent requests into one model call. Only
+# the threads of the thread executor share a batcher. A worker of the process
+# executor runs one task at a time, so its batcher would never combine two
+# requests and only add EMBEDDING_MAX_WAIT_MS to every call.
+EMBEDDING_BATCHING = INFERENCE_EXECUTOR_KIND == "thread" and (
+    CommonUtils().get_environment_variable("EMBEDDING_BATCHING", "true").lower() == "true"
+)
+EMBEDDING_MAX_BATCH_SIZE = int(
+    CommonUtils().get_environment_variable("EMBEDDING_MAX_BATCH_SIZE", "32")
+)
+EMBEDDING_MAX_WAIT_MS = float(
+    CommonUtils().get_environment_variable("EMBEDDING_MAX_WAIT_MS", "5")
+)
+
+# 1:N identification against every enrolled user
+IDENTIFICATION_TOP_K = 5
+# Seconds between two incremental syncs of the gallery with the database
+GALLERY_SYNC_INTERVAL = float(
+    CommonUtils().get_environment_variable("GALLERY_SYNC_INTERVAL", "30")
+)
+# Seconds of updated_at that every sync reads again. Writes of other processes
+# can become visible after a later one, e.g. behind replication lag.
+GALLERY_SYNC_OVERLAP = float(
+    CommonUtils().get_environment_variable("GALLERY_SYNC_OVERLAP", "60")
+)
+
+# Version of the stored embedding document. Version 1 is the legacy BSON array
+# of doubles, version 2 a pre-normalized little-endian float32 Binary blob.
+EMBEDDING_STORAGE_VERSION = 2
+# Version of the preprocessing that produced a stored embedding, recorded on
+# every enrolment. Version 1 is the preprocessing of DeepFace.represent,
+# including the second detection with REDETECTION_BACKEND. Any change that
+# moves the embedding of the same image needs a new version: the users listed
+# by data_access.stale_enrolments then have to enrol again, and
+# benchmarks/preprocessing_parity measures how far the scores move.
+EMBEDDING_PIPELINE_VERSION = 1
+
+# Longest side of the image handed to the face detector. Uploads are decoded
+# straight to about this size, which still leaves the face well above the
+# 160x160 input of Facenet for typical selfie frames.
+DETECTION_MAX_SIDE = int(
+    CommonUtils().get_environment_variable("DETECTION_MAX_SIDE", "640")
+)
+
+# Early exit login: frames are embedded one at a time and verification stops
+# once the running similarity is further than the margin from the threshold
+EARLY_EXIT_VERIFICATION = (
+    CommonUtils().get_environment_variable("EARLY_EXIT_VERIFICATION", "true").lower()
+    == "true"
+)
+EARLY_EXIT_MARGIN = float(
+    CommonUtils().get_environment_variable("EARLY_EXIT_MARGIN", "0.1")
+)
+# Frames embedded before an early decision. A single frame, spoofed or lucky,
+# must never decide a login that the mean of every frame would reject.
+EARLY_EXIT_MIN_FRAMES = int(
+    CommonUtils().get_environment_variable("EARLY_EXIT_MIN_FRAMES", "2")
+)
+
+# Per-frame templates kept for every user. Login scores the probe against all
+# of them at once and fuses the scores with "max", "mean" or "top_k" (the
+# mean of the TEMPLATE_FUSION_TOP_K best).
+MAX_TEMPLATES_PER_USER = int(
+    CommonUtils().get_environment_variable("MAX_TEMPLATES_PER_USER", "10")
+)
+TEMPLATE_FUSION = CommonUtils().get_environment_variable("TEMPLATE_FUSION", "max")
+TEMPLATE_FUSION_TOP_K = 3
+# A login at least this similar adds its probe to the templates of the user,
+# unless a template is already a near duplicate of it
+TEMPLATE_UPDATE_THRESHOLD = float(
+    CommonUtils().get_environment_variable("TEMPLATE_UPDATE_THRESHOLD", "0.85")
+)
+TEMPLATE_DUPLICATE_SIMILARITY = 0.97
+# Attempts of a template update that lost the race against another login or
+# an enrolment of the same user, each starting from the templates stored now
+TEMPLATE_UPDATE_ATTEMPTS = 3
+
+# Engine that runs the embedding model: "keras" through deepface, or "onnx"
+# through ONNX Runtime on the CPU. The ONNX model is exported once with
+# python -m face_authentication.inference.export_onnx
+EMBEDDING_BACKEND = CommonUtils().get_environment_variable("EMBEDDING_BACKEND", "keras")
+ONNX_MODEL_PATH = CommonUtils().get_environment_variable(
+    "ONNX_MODEL_PATH",
+    os.path.join(MODEL_CACHE_DIRECTORY, f"{EMBEDDING_MODEL_NAME.lower()}.onnx"),
+)
+# Threads of one ONNX Runtime session, 0 lets ONNX Runtime use every core.
+# Lower it when several inference workers share the machine.
+ONNX_INTRA_OP_THREADS = int(
+    CommonUtils().get_environment_variable("ONNX_INTRA_OP_THREADS", "0")
+)
+
+# Embeddings of already seen uploads, keyed by a hash of the image bytes. The
+# in-process cache holds at most EMBEDDING_CACHE_MAX_BYTES. Every entry costs
+# the same, its float32 embedding plus EMBEDDING_CACHE_ENTRY_OVERHEAD bytes for
+# the key, the array header and the dict entry (320 to 560 depending on how
+# full the dict table is, measured with tracemalloc), so the budget is turned
+# into a number of entries. Setting the shared directory (ideally on tmpfs,
+# e.g. /dev/shm/face_embeddings) also shares them between the workers of a
+# host. It is created, and its files written, readable by the service user
+# only.
+EMBEDDING_CACHE_MAX_BYTES = int(
+    CommonUtils().get_environment_variable(
+        "EMBEDDING_CACHE_MAX_BYTES", str(16 * 1024 * 1024)
+    )
+)
+EMBEDDING_CACHE_ENTRY_OVERHEAD = 576
+EMBEDDING_CACHE_SHARED_DIRECTORY = CommonUtils().get_environment_variable(
+    "EMBEDDING_CACHE_SHARED_DIRECTORY", ""
+)
+EMBEDDING_CACHE_SHARED_MAX_ENTRIES = int(
+    CommonUtils().get_environment_variable("EMBEDDING_CACHE_SHARED_MAX_ENTRIES", "100000")
+)
+
+# Uploads flagged as pre-cropped skip detection. They must already have the
+# input size of the embedding model and pass a cheap exposure and contrast
+# check: mean brightness inside the range and a pixel standard deviation of
+# at least the minimum, which rejects blank, black and washed out frames.
+PRECROPPED_BRIGHTNESS_RANGE = (20.0, 235.0)
+PRECROPPED_MIN_CONTRAST = 10.0
@@ -0,0 +1,19 @@
+from face_authentication.utilities.utilities import CommonUtils
+
+LOG_LEVEL = CommonUtils().get_environment_variable("LOG_LEVEL", "INFO").upper()
+# Where the JSON lines go. "stderr" leaves collecting them to the process
+# manager or the container runtime, the one writer of every process's lines,
+# and is what deployments with several workers use. "file" writes a single
+# file under LOG_DIRECTORY and rotates it once it grows past LOG_MAX_BYTES,
+# for single-process runs. Rotating a file shared by several processes loses
+# lines, so processes started by another Python process, e.g. uvicorn workers
+# or the inference and bulk enrolment pools, log to stderr either way.
+LOG_DESTINATION = CommonUtils().get_environment_variable("LOG_DESTINATION", "stderr")
+LOG_DIRECTORY = CommonUtils().get_environment_variable("LOG_DIRECTORY", "logs")
+LOG_FILE_NAME = CommonUtils().get_environment_variable(
+    "LOG_FILE_NAME", "face_authentication.log"
+)
+LOG_MAX_BYTES = int(
+    CommonUtils().get_environment_variable("LOG_MAX_BYTES", str(10 * 1024 * 1024))
+)
+LOG_BACKUP_COUNT = int(CommonUtils().get_environment_variable("LOG_BACKUP_COUNT", "5"))
@@ -1,2 +1,16 @@
+from face_authentication.utilities.utilities import CommonUtils
+
 HOST = "0.0.0.0"
-PORT = 8000
\ No newline at end of file
+PORT = 8000
+
+# Limits of the images uploaded to the /application routes, in bytes
+MAX_UPLOAD_FILE_SIZE = int(
+    CommonUtils().get_environment_variable("MAX_UPLOAD_FILE_SIZE", str(10 * 1024 * 1024))
+)
+MAX_UPLOAD_REQUEST_SIZE = int(
+    CommonUtils().get_environment_variable("MAX_UPLOAD_REQUEST_SIZE", str(50 * 1024 * 1024))
+)
+
+# "full" serves every route, "auth" serves only the login and registration
+# routes and never imports the face inference stack
+DEPLOYMENT_MODE = CommonUtils().get_environment_variable("DEPLOYMENT_MODE", "full")
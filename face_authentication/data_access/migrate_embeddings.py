@@ -0,0 +1,65 @@
+"""Convert the stored embeddings from BSON arrays to the binary format.
+
+Usage:
+    python -m face_authentication.data_access.migrate_embeddings [--batch-size N] [--dry-run]
+
+The read path accepts both formats, so the migration can run while the
+application is serving traffic and can be interrupted and started again.
+"""
+import argparse
+import sys
+
+from pymongo import UpdateOne
+
+from face_authentication.data_access.user_embedding_data import UserEmbeddingData
+from face_authentication.entity.user_embedding import Embedding
+from face_authentication.exception import AppException
+from face_authentication.logger import logging
+
+
+def migrate(batch_size: int = 500, dry_run: bool = False) -> int:
+    """Rewrite every legacy document in place and return how many were converted"""
+    try:
+        collection = UserEmbeddingData().collection
+        cursor = collection.find(
+            {"user_embed": {"$type": "array"}},
+            projection={"user_id": 1, "user_embed": 1},
+            batch_size=batch_size,
+        )
+        converted = 0
+        operations = []
+        for document in cursor:
+            # Without embed_pipeline, the converted array is still an
+            # embedding of the pipeline that produced it
+            update = Embedding(document["user_id"], document["user_embed"]).to_document()
+            # Only touch documents that still hold the legacy array
+            operations.append(
+                UpdateOne(
+                    {"_id": document["_id"], "user_embed": {"$type": "array"}},
+                    {"$set": update},
+                )
+            )
+            if len(operations) == batch_size:
+                converted += _flush(collection, operations, dry_run)
+                operations = []
+        if operations:
+            converted += _flush(collection, operations, dry_run)
+        logging.info(f"Converted {converted} embeddings to the binary format.......")
+        return converted
+    except Exception as e:
+        raise AppException(e, sys) from e
+
+
+def _flush(collection, operations: list, dry_run: bool) -> int:
+    if dry_run:
+        return len(operations)
+    result = collection.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print(f"Converted {migrate(args.batch_size, args.dry_run)} documents")
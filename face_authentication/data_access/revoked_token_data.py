@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from face_authentication.config.database import MongodbClient
+from face_authentication.constants.database import REVOKED_TOKEN_COLLECTION_NAME
+
+
+class RevokedTokenData:
+    """Ids of the logged out session tokens, shared by every worker"""
+
+    def __init__(self) -> None:
+        self.client = MongodbClient()
+        self.collection_name = REVOKED_TOKEN_COLLECTION_NAME
+        self.collection = self.client.database[self.collection_name]
+
+    def create_indexes(self) -> None:
+        """One document per token, removed by Mongo once the token has expired"""
+        self.collection.create_index("jti", unique=True)
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def revoke(self, jti: str, expires_at: datetime) -> None:
+        self.collection.update_one(
+            {"jti": jti}, {"$set": {"expires_at": expires_at}}, upsert=True
+        )
+
+    def is_revoked(self, jti: str) -> bool:
+        return self.collection.find_one({"jti": jti}, projection={"_id": 1}) is not None
+
+
+class AsyncRevokedTokenData:
+    """Awaitable counterpart of RevokedTokenData for the async routes"""
+
+    def __init__(self) -> None:
+        self.revoked_token_data = RevokedTokenData()
+
+    async def revoke(self, jti: str, expires_at: datetime) -> None:
+        await MongodbClient.run(self.revoked_token_data.revoke, jti, expires_at)
+
+    async def is_revoked(self, jti: str) -> bool:
+        return await MongodbClient.run(self.revoked_token_data.is_revoked, jti)
@@ -0,0 +1,47 @@
+"""List the users whose enrolment was embedded by an older pipeline.
+
+Usage:
+    python -m face_authentication.data_access.stale_enrolments [--count]
+
+Embeddings of different preprocessing pipelines are not exactly comparable,
+see EMBEDDING_PIPELINE_VERSION. The uploaded images are not kept, so the
+embeddings cannot be computed again. The listed users have to enrol again,
+which replaces their embedding with one of the current pipeline.
+"""
+import argparse
+import sys
+from typing import Iterator
+
+from face_authentication.constants.embeddings import EMBEDDING_PIPELINE_VERSION
+from face_authentication.data_access.user_embedding_data import UserEmbeddingData
+from face_authentication.exception import AppException
+
+
+def find_stale_enrolments(batch_size: int = 1000) -> Iterator[str]:
+    """Yield the user id of every enrolment of an older pipeline. Documents
+    without embed_pipeline predate the field, or were only converted by
+    migrate_embeddings, and are version 1."""
+    try:
+        query = {"embed_pipeline": {"$lt": EMBEDDING_PIPELINE_VERSION}}
+        if EMBEDDING_PIPELINE_VERSION > 1:
+            query = {"$or": [query, {"embed_pipeline": {"$exists": False}}]}
+        cursor = UserEmbeddingData().collection.find(
+            query,
+            projection={"user_id": 1},
+            batch_size=batch_size,
+        )
+        for document in cursor:
+            yield document["user_id"]
+    except Exception as e:
+        raise AppException(e, sys) from e
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", action="store_true")
+    args = parser.parse_args()
+    if args.count:
+        print(f"{sum(1 for _ in find_stale_enrolments())} stale enrolments")
+    else:
+        for user_id in find_stale_enrolments():
+            print(user_id)
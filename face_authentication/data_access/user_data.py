@@ -10,9 +10,33 @@ class UserData:
         self.collection_name = USER_COLLECTION_NAME
         self.collection = self.client.database[self.collection_name]
 
+    def create_indexes(self) -> None:
+        """Unique indexes that make duplicate registrations fail on insert"""
+        for field in ("email_id", "username", "uuid"):
+            self.collection.create_index(field, unique=True)
+
     def save_user(self, user: User) -> None:
         self.collection.insert_one(user)
 
     def get_user(self, query: dict):
         user = self.collection.find_one(query)
         return user
+
+    def update_user(self, query: dict, values: dict) -> None:
+        self.collection.update_one(query, {"$set": values})
+
+
+class AsyncUserData:
+    """Awaitable counterpart of UserData for the async routes"""
+
+    def __init__(self) -> None:
+        self.user_data = UserData()
+
+    async def save_user(self, user: User) -> None:
+        await MongodbClient.run(self.user_data.save_user, user)
+
+    async def get_user(self, query: dict):
+        return await MongodbClient.run(self.user_data.get_user, query)
+
+    async def update_user(self, query: dict, values: dict) -> None:
+        await MongodbClient.run(self.user_data.update_user, query, values)
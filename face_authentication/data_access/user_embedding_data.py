@@ -1,19 +1,148 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+
 from face_authentication.config.database import MongodbClient
-from face_authentication.constants.database import USER_EMBEDDING_COLLECTION_NAME
+from face_authentication.constants.database import (
+    USER_EMBEDDING_CACHE_SIZE,
+    USER_EMBEDDING_CACHE_TTL,
+    USER_EMBEDDING_COLLECTION_NAME,
+)
+from face_authentication.entity.user_embedding import Embedding
+from face_authentication.utilities.cache import LRUCache
 
 
 class UserEmbeddingData:
+    # Shared by every instance of the process, holds L2 normalized float32
+    # embeddings. Other workers only see a new enrolment once the TTL expires.
+    cache = LRUCache(
+        USER_EMBEDDING_CACHE_SIZE, USER_EMBEDDING_CACHE_TTL, name="user_embedding"
+    )
+    # Per-frame templates of the users, shape (T, EMBEDDING_SIZE), with the
+    # template_version they were read at
+    templates_cache = LRUCache(
+        USER_EMBEDDING_CACHE_SIZE, USER_EMBEDDING_CACHE_TTL, name="user_templates"
+    )
+
     def __init__(self) -> None:
         self.client = MongodbClient()
         self.collection_name = USER_EMBEDDING_COLLECTION_NAME
         self.collection = self.client.database[self.collection_name]
 
-    def save_user_embedding(self, user_id: str, embedding_list) -> None:
-        self.collection.insert_one({"user_id": user_id, "user_embed": embedding_list})
+    def create_indexes(self) -> None:
+        """One embedding document per user, updated_at for the gallery sync"""
+        self.collection.create_index("user_id", unique=True)
+        self.collection.create_index("updated_at")
+
+    def save_user_embedding(
+        self, user_id: str, embedding: np.ndarray, templates: np.ndarray = None
+    ) -> None:
+        """Replace the enrolment of the user in one atomic upsert, so a
+        concurrent reader never sees the user without an embedding"""
+        self.collection.update_one(
+            {"user_id": user_id},
+            Embedding(user_id, embedding, templates).to_update(),
+            upsert=True,
+        )
+        UserEmbeddingData.cache.invalidate(user_id)
+        UserEmbeddingData.templates_cache.invalidate(user_id)
+
+    def update_user_templates(
+        self, user_id: str, templates: np.ndarray, version: int
+    ) -> bool:
+        """Replace the templates of the user in place, unless they were
+        written since they were read at version. The mean embedding used for
+        identification is left as enrolled.
+        Returns:
+            bool: False when another write came first
+        """
+        query = {"user_id": user_id, "template_version": version}
+        if version == 0:
+            query["template_version"] = {"$exists": False}
+        result = self.collection.update_one(
+            query,
+            {
+                "$set": Embedding.encode_templates(templates),
+                "$inc": {"template_version": 1},
+            },
+        )
+        UserEmbeddingData.templates_cache.invalidate(user_id)
+        return result.matched_count == 1
 
     def get_user_embedding(self, user_id: str) -> dict:
         user: dict = self.collection.find_one({"user_id": user_id})
         if user != None:
             return user
         else:
-            return None
\ No newline at end of file
+            return None
+
+    def get_embeddings_updated_since(self, since: datetime = None):
+        """Return the embedding documents written at or after since, every
+        document when since is None"""
+        query = {} if since is None else {"updated_at": {"$gte": since}}
+        return self.collection.find(
+            query, projection={"user_id": 1, "user_embed": 1, "updated_at": 1}
+        )
+
+    def get_normalized_embedding(self, user_id: str) -> Optional[np.ndarray]:
+        """Return the stored embedding of the user as a unit length float32
+        array, reading Mongo only on a cache miss"""
+        embedding = UserEmbeddingData.cache.get(user_id)
+        if embedding is not None:
+            return embedding
+        user = self.get_user_embedding(user_id)
+        if user is None or user.get("user_embed") is None:
+            return None
+        embedding = Embedding.decode(user)
+        UserEmbeddingData.cache.set(user_id, embedding)
+        return embedding
+
+    def get_user_templates(
+        self, user_id: str, cached: bool = True
+    ) -> Optional[Tuple[np.ndarray, int]]:
+        """Return the unit length templates of the user and their
+        template_version, reading Mongo only on a cache miss unless cached is
+        False"""
+        if cached:
+            entry = UserEmbeddingData.templates_cache.get(user_id)
+            if entry is not None:
+                return entry
+        user = self.get_user_embedding(user_id)
+        if user is None or user.get("user_embed") is None:
+            return None
+        entry = (Embedding.decode_templates(user), Embedding.template_version(user))
+        UserEmbeddingData.templates_cache.set(user_id, entry)
+        return entry
+
+    @staticmethod
+    def cache_stats() -> dict:
+        return {
+            "user_embedding": UserEmbeddingData.cache.stats(),
+            "user_templates": UserEmbeddingData.templates_cache.stats(),
+        }
+
+
+class AsyncUserEmbeddingData:
+    """Awaitable counterpart of UserEmbeddingData for the async routes"""
+
+    def __init__(self) -> None:
+        self.user_embedding_data = UserEmbeddingData()
+
+    async def save_user_embedding(
+        self, user_id: str, embedding: np.ndarray, templates: np.ndarray = None
+    ) -> None:
+        await MongodbClient.run(
+            self.user_embedding_data.save_user_embedding, user_id, embedding, templates
+        )
+
+    async def get_user_embedding(self, user_id: str) -> dict:
+        return await MongodbClient.run(
+            self.user_embedding_data.get_user_embedding, user_id
+        )
+
+    async def get_normalized_embedding(self, user_id: str) -> Optional[np.ndarray]:
+        return await MongodbClient.run(
+            self.user_embedding_data.get_normalized_embedding, user_id
+        )
+
@@ -1,11 +1,100 @@
+import numpy as np
+from bson.binary import Binary
+
+from face_authentication.constants.embeddings import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_PIPELINE_VERSION,
+    EMBEDDING_SIZE,
+    EMBEDDING_STORAGE_VERSION,
+)
+
+# Little-endian float32, independent of the byte order of the host
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
 class Embedding:
 
-    def __init__(self, user_id: str = None, user_embedding=None) -> None:
+    def __init__(self, user_id: str = None, user_embedding=None, templates=None) -> None:
         self.user_id = user_id
         self.user_embedding = user_embedding
+        self.templates = templates
 
     def to_dict(self) -> dict:
         return self.__dict__
 
+    def to_document(self) -> dict:
+        """Encode the embedding as a normalized float32 Binary blob together
+        with its original norm and the model that produced it"""
+        embedding = np.asarray(self.user_embedding, dtype=EMBEDDING_DTYPE)
+        norm = float(np.linalg.norm(embedding))
+        document = {
+            "user_id": self.user_id,
+            "user_embed": Binary((embedding / norm).astype(EMBEDDING_DTYPE).tobytes()),
+            "embed_norm": norm,
+            "embed_model": EMBEDDING_MODEL_NAME,
+            "embed_version": EMBEDDING_STORAGE_VERSION,
+        }
+        if self.templates is not None:
+            document.update(Embedding.encode_templates(self.templates))
+        return document
+
+    def to_update(self) -> dict:
+        """Update that replaces a stored enrolment in place with one embedded
+        now, stamped with the current pipeline. updated_at is set from the
+        clock of the server, the gallery sync reads by it."""
+        document = self.to_document()
+        # Only fresh enrolments, a conversion of the storage format keeps the
+        # embedding of whichever pipeline produced it
+        document["embed_pipeline"] = EMBEDDING_PIPELINE_VERSION
+        update = {
+            "$set": document,
+            "$currentDate": {"updated_at": True},
+            # Fails template updates computed from the previous enrolment
+            "$inc": {"template_version": 1},
+        }
+        if self.templates is None:
+            # Drop the templates of an earlier enrolment
+            update["$unset"] = {"user_templates": "", "template_count": ""}
+        return update
+
+    @staticmethod
+    def encode_templates(templates: np.ndarray) -> dict:
+        """Encode the templates as one contiguous blob of unit length float32
+        rows"""
+        templates = np.asarray(templates, dtype=EMBEDDING_DTYPE)
+        templates = templates / np.linalg.norm(templates, axis=1, keepdims=True)
+        return {
+            "user_templates": Binary(templates.astype(EMBEDDING_DTYPE).tobytes()),
+            "template_count": len(templates),
+        }
+
+    @staticmethod
+    def template_version(document: dict) -> int:
+        """Number of writes of the templates of a stored document, 0 for
+        documents enrolled before it was counted"""
+        return document.get("template_version", 0)
+
+    @staticmethod
+    def decode_templates(document: dict) -> np.ndarray:
+        """Return the templates of a stored document as an array of shape
+        (T, EMBEDDING_SIZE). Documents enrolled before templates existed have
+        their mean embedding as the only template."""
+        if document.get("user_templates") is None:
+            return Embedding.decode(document)[np.newaxis]
+        return np.frombuffer(document["user_templates"], dtype=EMBEDDING_DTYPE).reshape(
+            -1, EMBEDDING_SIZE
+        )
+
+    @staticmethod
+    def decode(document: dict) -> np.ndarray:
+        """Return the unit length float32 embedding of a stored document,
+        accepting both the binary and the legacy array format"""
+        user_embed = document["user_embed"]
+        if isinstance(user_embed, bytes):
+            # Zero copy, read-only view over the BSON payload
+            return np.frombuffer(user_embed, dtype=EMBEDDING_DTYPE)
+        embedding = np.asarray(user_embed, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
     def __str__(self) -> str:
-        return str(self.to_dict())
\ No newline at end of file
+        return str(self.to_dict())
@@ -1,5 +1,14 @@
 import sys
 
+
+def _restore_app_exception(error_message: str):
+    """Rebuild an AppException from its formatted message after unpickling"""
+    exception = AppException.__new__(AppException)
+    Exception.__init__(exception, error_message)
+    exception.error_message = error_message
+    return exception
+
+
 class AppException(Exception):
    
     def __init__(self, error_message: Exception, error_detail: sys):
@@ -27,6 +36,13 @@ class AppException(Exception):
 
         return error_message
 
+    def __reduce__(self):
+        """
+        error_detail cannot be pickled, so exceptions raised inside a worker
+        process are sent back with their formatted message only
+        """
+        return _restore_app_exception, (self.error_message,)
+
     def __repr__(self):
         """
         Formating object of AppException
@@ -0,0 +1,136 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import numpy as np
+
+from face_authentication.constants.embeddings import (
+    EMBEDDING_MAX_BATCH_SIZE,
+    EMBEDDING_MAX_WAIT_MS,
+)
+from face_authentication.exception import AppException
+from face_authentication.inference.model_registry import ModelRegistry
+from face_authentication.logger import logging
+from face_authentication.metrics import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCHER_QUEUE_DEPTH,
+)
+
+
+class EmbeddingBatcher:
+    """Collects faces from concurrent requests and embeds them together.
+
+    Callers block in ``embed`` while a single scheduler thread drains the
+    queue, flushing a batch once it holds ``max_batch_size`` faces or the
+    oldest face has waited ``max_wait_ms``. The embeddings are then scattered
+    back to the waiting callers.
+    """
+
+    batcher = None
+    batcher_lock = threading.Lock()
+
+    def __init__(
+        self,
+        predict: Callable[[np.ndarray], np.ndarray] = ModelRegistry.embed,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+    ) -> None:
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.queued_faces = 0
+        self.batches = 0
+        self.batched_faces = 0
+        self.full_flushes = 0
+        self.timeout_flushes = 0
+        self.thread = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self.thread.start()
+
+    @staticmethod
+    def get_batcher() -> "EmbeddingBatcher":
+        """Return the batcher shared by the whole process"""
+        with EmbeddingBatcher.batcher_lock:
+            if EmbeddingBatcher.batcher is None:
+                EmbeddingBatcher.batcher = EmbeddingBatcher()
+        return EmbeddingBatcher.batcher
+
+    def embed(self, faces: np.ndarray) -> np.ndarray:
+        """Queue the faces of one request and wait for their embeddings
+        Args:
+            faces (np.ndarray): Faces of shape (N, height, width, 3)
+        Returns:
+            np.ndarray: Embeddings of shape (N, EMBEDDING_SIZE)
+        """
+        future = Future()
+        with self.lock:
+            self.queued_faces += len(faces)
+        EMBEDDING_BATCHER_QUEUE_DEPTH.inc(len(faces))
+        self.queue.put((faces, future))
+        return future.result()
+
+    def _collect(self) -> list:
+        """Block for the first request, then gather more until the batch is
+        full or the wait deadline passes"""
+        items = [self.queue.get()]
+        size = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            size += len(item[0])
+        with self.lock:
+            self.queued_faces -= size
+            self.batches += 1
+            self.batched_faces += size
+            if size >= self.max_batch_size:
+                self.full_flushes += 1
+            else:
+                self.timeout_flushes += 1
+        EMBEDDING_BATCHER_QUEUE_DEPTH.dec(size)
+        EMBEDDING_BATCH_SIZE.observe(size)
+        return items
+
+    def _run(self) -> None:
+        while True:
+            items = self._collect()
+            try:
+                embeddings = self.predict(np.concatenate([faces for faces, _ in items]))
+            except Exception as e:
+                logging.info(f"Embedding batch of {len(items)} requests failed.......")
+                for _, future in items:
+                    future.set_exception(AppException(e, sys))
+                continue
+            start = 0
+            for faces, future in items:
+                future.set_result(embeddings[start:start + len(faces)])
+                start += len(faces)
+
+    def stats(self) -> dict:
+        """Queue depth and batch fill of the scheduler"""
+        with self.lock:
+            return {
+                "queue_depth": self.queued_faces,
+                "batches": self.batches,
+                "batched_faces": self.batched_faces,
+                "full_flushes": self.full_flushes,
+                "timeout_flushes": self.timeout_flushes,
+                "average_batch_fill": (
+                    self.batched_faces / (self.batches * self.max_batch_size)
+                    if self.batches
+                    else 0.0
+                ),
+            }
+
@@ -0,0 +1,291 @@
+"""Enroll the faces of an existing photo archive without going through HTTP.
+
+Usage:
+    python -m face_authentication.inference.bulk_enroll SOURCE [--checkpoint PATH]
+        [--workers N] [--threads-per-worker N] [--users-per-task N] [--write-chunk N]
+
+SOURCE is either a directory or a CSV manifest. In a directory every
+sub-directory is a user id holding that user's images, and a loose image is
+enrolled under its file name without extension. A manifest has the columns
+user_id and path, one row per image, with paths relative to the manifest.
+
+The images are embedded by a pool of worker processes that each load the
+models once and embed all faces of a task in batches of
+EMBEDDING_MAX_BATCH_SIZE. The enrolments are written with unordered
+bulk_write calls of --write-chunk users and then appended to the checkpoint,
+so an interrupted run started again with the same checkpoint skips every
+user already written.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from face_authentication.constants.embeddings import (
+    EMBEDDING_MAX_BATCH_SIZE,
+    INFERENCE_WORKERS,
+)
+from face_authentication.data_access.user_embedding_data import UserEmbeddingData
+from face_authentication.entity.user_embedding import Embedding
+from face_authentication.exception import AppException
+from face_authentication.inference.executor import _load_models
+from face_authentication.logger import logging
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def read_source(source: str) -> Dict[str, List[str]]:
+    """Map every user id of a directory or manifest to its image paths"""
+    users = defaultdict(list)
+    if os.path.isdir(source):
+        for entry in sorted(os.scandir(source), key=lambda entry: entry.name):
+            if entry.is_dir():
+                users[entry.name] = [
+                    os.path.join(entry.path, name)
+                    for name in sorted(os.listdir(entry.path))
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                ]
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                users[os.path.splitext(entry.name)[0]].append(entry.path)
+    else:
+        directory = os.path.dirname(os.path.abspath(source))
+        with open(source, newline="") as manifest:
+            for row in csv.DictReader(manifest):
+                users[row["user_id"]].append(os.path.join(directory, row["path"]))
+    return {user_id: paths for user_id, paths in users.items() if paths}
+
+
+def read_checkpoint(path: str) -> set:
+    """User ids already written by an earlier run"""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as checkpoint:
+        return {json.loads(line)["user_id"] for line in checkpoint if line.strip()}
+
+
+def embed_users(users: List[Tuple[str, List[str]]]) -> Tuple[list, list]:
+    """Embed the images of a few users in one go, runs in a worker process
+    Returns:
+        Tuple[list, list]: (user_id, mean, templates) of every enrolled user
+            and (user_id, error) of every user that failed
+    """
+    from face_authentication.inference.model_registry import ModelRegistry
+    from face_authentication.inference.preprocessing import decode_image
+    from face_authentication.validation.user_embedding import (
+        UserLoginEmbeddingValidation,
+        UserRegisterEmbeddingValidation,
+    )
+
+    faces, owners, failed = [], [], []
+    for user_id, paths in users:
+        try:
+            for path in paths:
+                with open(path, "rb") as image:
+                    img_array = decode_image(image.read())
+                faces.append(UserLoginEmbeddingValidation.extract_face(img_array))
+                owners.append(user_id)
+        except Exception as e:
+            # Drop the faces of a user with an unusable image, enroll the rest
+            while owners and owners[-1] == user_id:
+                owners.pop()
+                faces.pop()
+            failed.append((user_id, str(e)))
+    if not faces:
+        return [], failed
+
+    faces = np.concatenate(faces)
+    embeddings = np.concatenate(
+        [
+            ModelRegistry.embed(faces[start : start + EMBEDDING_MAX_BATCH_SIZE])
+            for start in range(0, len(faces), EMBEDDING_MAX_BATCH_SIZE)
+        ]
+    )
+    owners = np.asarray(owners)
+    enrolled = []
+    for user_id in dict.fromkeys(owners):
+        embedding_list = embeddings[owners == user_id]
+        enrolled.append(
+            (
+                str(user_id),
+                UserLoginEmbeddingValidation.average_embedding(embedding_list),
+                UserRegisterEmbeddingValidation.select_templates(embedding_list),
+            )
+        )
+    return enrolled, failed
+
+
+class BulkEnroller:
+    def __init__(
+        self,
+        checkpoint: str,
+        workers: int = INFERENCE_WORKERS,
+        users_per_task: int = 16,
+        write_chunk: int = 500,
+    ) -> None:
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.users_per_task = users_per_task
+        self.write_chunk = write_chunk
+        self.collection = UserEmbeddingData().collection
+        self.pending = []
+        self.enrolled = 0
+        self.failed = 0
+        self.images = 0
+        self.total = 0
+        self.start_time = time.perf_counter()
+
+    def run(self, source: str) -> dict:
+        try:
+            users = read_source(source)
+            done = read_checkpoint(self.checkpoint)
+            todo = [
+                (user_id, paths) for user_id, paths in users.items() if user_id not in done
+            ]
+            logging.info(
+                f"Enrolling {len(todo)} users, {len(users) - len(todo)} already "
+                "in the checkpoint ......."
+            )
+            tasks = [
+                todo[start : start + self.users_per_task]
+                for start in range(0, len(todo), self.users_per_task)
+            ]
+            self.start_time = time.perf_counter()
+            self.total = len(todo)
+            executor = self.start_executor()
+            try:
+                in_flight = {}
+                # Keep every worker busy without queueing the whole archive
+                while tasks or in_flight:
+                    while tasks and len(in_flight) < 2 * self.workers:
+                        task = tasks.pop(0)
+                        in_flight[executor.submit(embed_users, task)] = task
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    broken = False
+                    for future in finished:
+                        task = in_flight.pop(future)
+                        try:
+                            self.record(task, *future.result())
+                        except BrokenProcessPool:
+                            broken = True
+                            self.record_error(task, "worker process died")
+                        except Exception as e:
+                            self.record_error(task, repr(e))
+                    if broken:
+                        # The pool is unusable and every task still in it lost
+                        for task in in_flight.values():
+                            self.record_error(task, "worker process died")
+                        in_flight = {}
+                        logging.info("A worker process died, restarting the pool .......")
+                        executor.shutdown(cancel_futures=True)
+                        executor = self.start_executor()
+                    if len(self.pending) >= self.write_chunk:
+                        self.flush()
+                    self.report_progress()
+            finally:
+                executor.shutdown(cancel_futures=True)
+            self.flush()
+            self.report_progress()
+            print(file=sys.stderr)
+            return self.summary()
+        except Exception as e:
+            raise AppException(e, sys) from e
+
+    def record(self, task: list, enrolled: list, failed: list) -> None:
+        """Queue the enrolments of a finished task for the next write"""
+        self.images += sum(len(paths) for _, paths in task)
+        self.pending.extend(enrolled)
+        self.failed += len(failed)
+        for user_id, error in failed:
+            logging.info(f"Skipped user {user_id}: {error}")
+
+    def record_error(self, task: list, error: str) -> None:
+        """Count every user of a task that raised as failed. Only this task is
+        lost, its users never reach the checkpoint, so running again retries
+        them."""
+        self.record(task, [], [(user_id, error) for user_id, _ in task])
+
+    def start_executor(self) -> ProcessPoolExecutor:
+        # spawn, as forking a process that already imported tensorflow is not safe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_models,
+        )
+
+    def flush(self) -> None:
+        """Write the pending enrolments and record them in the checkpoint"""
+        if not self.pending:
+            return
+        user_ids = [user_id for user_id, _, _ in self.pending]
+        # The same atomic upsert as save_user_embedding, one per user, so the
+        # order of an unordered bulk does not matter
+        self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user_id},
+                    Embedding(user_id, embedding, templates).to_update(),
+                    upsert=True,
+                )
+                for user_id, embedding, templates in self.pending
+            ],
+            ordered=False,
+        )
+        with open(self.checkpoint, "a") as checkpoint:
+            for user_id in user_ids:
+                checkpoint.write(json.dumps({"user_id": user_id}) + "\n")
+        self.enrolled += len(self.pending)
+        self.pending = []
+
+    def summary(self) -> dict:
+        seconds = time.perf_counter() - self.start_time
+        return {
+            "enrolled": self.enrolled,
+            "failed": self.failed,
+            "images": self.images,
+            "seconds": seconds,
+            "users_per_second": self.enrolled / seconds if seconds else 0.0,
+            "images_per_second": self.images / seconds if seconds else 0.0,
+        }
+
+    def report_progress(self) -> None:
+        summary = self.summary()
+        processed = self.enrolled + len(self.pending) + self.failed
+        remaining = self.total - processed
+        rate = processed / summary["seconds"] if summary["seconds"] else 0.0
+        eta = remaining / rate if rate else float("inf")
+        print(
+            f"\r{processed}/{self.total} users, {summary['images_per_second']:.1f} images/s, "
+            f"{rate:.1f} users/s, ETA {eta:.0f}s",
+            end="",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source")
+    parser.add_argument("--checkpoint", default="bulk_enroll.checkpoint")
+    parser.add_argument("--workers", type=int, default=INFERENCE_WORKERS)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--users-per-task", type=int, default=16)
+    parser.add_argument("--write-chunk", type=int, default=500)
+    args = parser.parse_args()
+    # One process per core scales better than every process using every core.
+    # Set before the workers are spawned, they inherit the environment.
+    for variable in ("TF_NUM_INTRAOP_THREADS", "OMP_NUM_THREADS", "ONNX_INTRA_OP_THREADS"):
+        os.environ.setdefault(variable, str(args.threads_per_worker))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+    enroller = BulkEnroller(
+        args.checkpoint, args.workers, args.users_per_task, args.write_chunk
+    )
+    print(json.dumps(enroller.run(args.source), indent=2))
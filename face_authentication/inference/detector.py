@@ -0,0 +1,126 @@
+import threading
+from typing import List
+
+import numpy as np
+
+from face_authentication.constants.embeddings import (
+    DETECTOR_CASCADE,
+    DETECTOR_MIN_FACE_FRACTION,
+    ENFORCE_DETECTION,
+    REDETECTION_BACKEND,
+)
+from face_authentication.inference.model_registry import ModelRegistry
+from face_authentication.logger import logging
+from face_authentication.metrics import DETECTION_FAILURES, DETECTOR_RUNS
+
+
+class DetectorCascade:
+    """Runs the cheap detectors first and falls back to the next backend only
+    when no face, or only an implausibly small one, was found.
+
+    ``stats`` counts per backend how often it ran and how often it produced
+    the face, so the fallback rate of every stage can be read off directly.
+    """
+
+    cascade = None
+
+    def __init__(
+        self,
+        backends: List[str] = DETECTOR_CASCADE,
+        min_face_fraction: float = DETECTOR_MIN_FACE_FRACTION,
+    ) -> None:
+        self.backends = backends
+        self.min_face_fraction = min_face_fraction
+        self.lock = threading.Lock()
+        self.counters = {backend: {"runs": 0, "hits": 0} for backend in backends}
+        self.misses = 0
+
+    @staticmethod
+    def get_cascade() -> "DetectorCascade":
+        """Return the cascade shared by the whole process"""
+        if DetectorCascade.cascade is None:
+            DetectorCascade.cascade = DetectorCascade()
+        return DetectorCascade.cascade
+
+    def detect(self, img_array: np.ndarray) -> np.ndarray:
+        """Return the aligned face crop of the image
+        Args:
+            img_array (np.ndarray): Image array
+        Returns:
+            np.ndarray: The face, or the whole image when no face was found
+                and ENFORCE_DETECTION is off
+        """
+        min_side = self.min_face_fraction * min(img_array.shape[:2])
+        for backend in self.backends:
+            face = self._detect(backend, img_array)
+            with self.lock:
+                self.counters[backend]["runs"] += 1
+            # The last stage is trusted with whatever it found
+            if face is not None and (
+                backend == self.backends[-1] or min(face.shape[:2]) >= min_side
+            ):
+                with self.lock:
+                    self.counters[backend]["hits"] += 1
+                DETECTOR_RUNS.labels(backend=backend, outcome="hit").inc()
+                return face
+            DETECTOR_RUNS.labels(backend=backend, outcome="fallback").inc()
+        with self.lock:
+            self.misses += 1
+        DETECTION_FAILURES.inc()
+        if ENFORCE_DETECTION:
+            raise ValueError("Face could not be detected")
+        logging.info("No face detected, using the whole image.......")
+        return img_array
+
+    @staticmethod
+    def redetect(face: np.ndarray) -> np.ndarray:
+        """Detect the face once more inside a face crop, as DeepFace.represent
+        does before resizing, and keep the crop when nothing is found there
+        Args:
+            face (np.ndarray): Face crop returned by detect
+        Returns:
+            np.ndarray: The first face REDETECTION_BACKEND finds in the crop
+        """
+        ModelRegistry.prepare_model_directory()
+        from deepface.detectors import FaceDetector
+
+        try:
+            inner, _ = FaceDetector.detect_face(
+                ModelRegistry.get_detector(REDETECTION_BACKEND),
+                REDETECTION_BACKEND,
+                face,
+                align=True,
+            )
+        except Exception:
+            return face
+        if inner is None or inner.shape[0] == 0 or inner.shape[1] == 0:
+            return face
+        return inner
+
+    @staticmethod
+    def _detect(backend: str, img_array: np.ndarray):
+        ModelRegistry.prepare_model_directory()
+        from deepface.detectors import FaceDetector
+
+        try:
+            faces = FaceDetector.detect_faces(
+                ModelRegistry.get_detector(backend), backend, img_array, align=True
+            )
+        except Exception:
+            # deepface raises when a detected box cannot be aligned
+            return None
+        faces = [face for face, _ in faces if face.shape[0] > 0 and face.shape[1] > 0]
+        if not faces:
+            return None
+        # Keep the largest face, which is the one closest to the camera
+        return max(faces, key=lambda face: face.shape[0] * face.shape[1])
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "stages": {
+                    backend: dict(counters)
+                    for backend, counters in self.counters.items()
+                },
+                "misses": self.misses,
+            }
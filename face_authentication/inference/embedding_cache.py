@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+import uuid
+from typing import Optional
+
+import numpy as np
+
+from face_authentication.constants.embeddings import (
+    DETECTION_MAX_SIDE,
+    DETECTOR_CASCADE,
+    EMBEDDING_BACKEND,
+    EMBEDDING_CACHE_ENTRY_OVERHEAD,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_CACHE_SHARED_DIRECTORY,
+    EMBEDDING_CACHE_SHARED_MAX_ENTRIES,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_PIPELINE_VERSION,
+    EMBEDDING_SIZE,
+)
+from face_authentication.logger import logging
+from face_authentication.metrics import EMBEDDING_CACHE_LOOKUPS
+from face_authentication.utilities.cache import LRUCache
+
+# Everything that changes the embedding of the same bytes. Keys made under
+# another configuration never match.
+PIPELINE_VERSION = (
+    f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}:{EMBEDDING_PIPELINE_VERSION}:"
+    f"{','.join(DETECTOR_CASCADE)}:{DETECTION_MAX_SIDE}"
+).encode()
+# Memory held by one entry of the in-process cache
+ENTRY_BYTES = (
+    EMBEDDING_SIZE * np.dtype(np.float32).itemsize + EMBEDDING_CACHE_ENTRY_OVERHEAD
+)
+
+
+class UploadedFace:
+    """An uploaded image after the extract stage: its preprocessed face, or
+    its embedding when the same bytes were embedded before"""
+
+    __slots__ = ("key", "face", "embedding")
+
+    def __init__(
+        self, key: Optional[str], face: np.ndarray = None, embedding: np.ndarray = None
+    ) -> None:
+        self.key = key
+        self.face = face
+        self.embedding = embedding
+
+
+class SharedEmbeddingStore:
+    """Embeddings as small files in a directory every worker of the host can
+    read. Writes go through a rename, so readers never see a partial file.
+    Hits touch the file, and the least recently used files are pruned once
+    there are more than max_entries. The embeddings identify the uploaded
+    faces, so only the owner may list the directory or read its files."""
+
+    # Check the size of the store every this many writes
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, directory: str, max_entries: int) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        self.writes = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # makedirs applies the umask and leaves an existing directory as it is
+        os.chmod(directory, 0o700)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        try:
+            embedding = np.fromfile(self._path(key), dtype=np.float32)
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        # A file of the wrong size is a leftover of another model, ignore it
+        return embedding if embedding.size == EMBEDDING_SIZE else None
+
+    def set(self, key: str, embedding: np.ndarray) -> None:
+        temporary = self._path(f".{key}.{uuid.uuid4().hex}")
+        contents = np.asarray(embedding, dtype=np.float32).tobytes()
+        try:
+            descriptor = os.open(
+                temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600
+            )
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(contents)
+            os.replace(temporary, self._path(key))
+        except OSError:
+            logging.exception("Writing to the shared embedding cache failed.......")
+            return
+        with self.lock:
+            self.writes += 1
+            prune = self.writes % SharedEmbeddingStore.PRUNE_INTERVAL == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> None:
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class EmbeddingCache:
+    """Embeddings of uploaded images keyed by a hash of their bytes, so that
+    frames sent again by retrying clients skip decoding, detection and the
+    model entirely. The in-process entries all have the same size, so
+    max_bytes bounds their number."""
+
+    cache = None
+
+    def __init__(
+        self,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+        shared_directory: str = EMBEDDING_CACHE_SHARED_DIRECTORY,
+        shared_max_entries: int = EMBEDDING_CACHE_SHARED_MAX_ENTRIES,
+    ) -> None:
+        self.memory = LRUCache(max(1, max_bytes // ENTRY_BYTES))
+        self.shared = (
+            SharedEmbeddingStore(shared_directory, shared_max_entries)
+            if shared_directory
+            else None
+        )
+
+    @staticmethod
+    def get_cache() -> "EmbeddingCache":
+        """Return the cache shared by the whole process"""
+        if EmbeddingCache.cache is None:
+            EmbeddingCache.cache = EmbeddingCache()
+        return EmbeddingCache.cache
+
+    @staticmethod
+    def key(contents: bytes, pre_cropped: bool = False) -> str:
+        # The same bytes embed differently with and without detection
+        digest = hashlib.blake2b(PIPELINE_VERSION, digest_size=16)
+        digest.update(b"pre-cropped" if pre_cropped else b"detected")
+        digest.update(contents)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        embedding = self.memory.get(key)
+        EMBEDDING_CACHE_LOOKUPS.labels(
+            store="memory", result="miss" if embedding is None else "hit"
+        ).inc()
+        if embedding is not None or self.shared is None:
+            return embedding
+        embedding = self.shared.get(key)
+        EMBEDDING_CACHE_LOOKUPS.labels(
+            store="shared", result="miss" if embedding is None else "hit"
+        ).inc()
+        if embedding is not None:
+            self.memory.set(key, embedding)
+        return embedding
+
+    def set(self, key: str, embedding: np.ndarray) -> None:
+        embedding = np.array(embedding, dtype=np.float32)
+        self.memory.set(key, embedding)
+        if self.shared is not None:
+            self.shared.set(key, embedding)
+
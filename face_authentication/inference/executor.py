@@ -0,0 +1,101 @@
+import asyncio
+import multiprocessing
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from face_authentication.constants.embeddings import (
+    INFERENCE_EXECUTOR_KIND,
+    INFERENCE_WORKERS,
+)
+from face_authentication.exception import AppException
+from face_authentication.inference.model_registry import ModelRegistry
+from face_authentication.logger import (
+    get_request_id,
+    in_context,
+    logging,
+    run_with_request_id,
+)
+from face_authentication.metrics import INFERENCE_IN_FLIGHT
+
+
+def _load_models() -> None:
+    """Initializer of every worker process"""
+    ModelRegistry().load()
+
+
+def _is_ready() -> bool:
+    return ModelRegistry.is_ready()
+
+
+class InferenceExecutor:
+    """Runs the CPU bound face inference outside of the event loop.
+
+    A thread pool shares the models of the web process, a process pool loads
+    them once in every worker through the pool initializer.
+    """
+
+    executor: Executor = None
+    ready = False
+
+    def __init__(
+        self, kind: str = INFERENCE_EXECUTOR_KIND, workers: int = INFERENCE_WORKERS
+    ) -> None:
+        self.kind = kind
+        self.workers = workers
+
+    def start(self) -> None:
+        """Create the pool and make sure the models are loaded before traffic
+        is routed to this worker"""
+        try:
+            if InferenceExecutor.executor is not None:
+                return
+            logging.info(
+                f"Starting {self.workers} {self.kind} inference workers ......."
+            )
+            if self.kind == "process":
+                # spawn, as forking a process that already imported tensorflow
+                # is not safe
+                InferenceExecutor.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_load_models,
+                )
+                futures = [
+                    InferenceExecutor.executor.submit(_is_ready)
+                    for _ in range(self.workers)
+                ]
+                InferenceExecutor.ready = all(future.result() for future in futures)
+            elif self.kind == "thread":
+                ModelRegistry().load()
+                InferenceExecutor.executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="inference"
+                )
+                InferenceExecutor.ready = ModelRegistry.is_ready()
+            else:
+                raise ValueError(f"Unknown inference executor kind: {self.kind}")
+        except Exception as e:
+            raise AppException(e, sys) from e
+
+    def shutdown(self) -> None:
+        if InferenceExecutor.executor is not None:
+            InferenceExecutor.executor.shutdown(wait=True)
+        InferenceExecutor.executor = None
+        InferenceExecutor.ready = False
+
+    async def run(self, func, *args):
+        """Run func(*args) on the pool and await its result"""
+        if InferenceExecutor.executor is None:
+            self.start()
+        if self.kind == "process":
+            # Stages timed in the worker process are not sent back
+            task = partial(run_with_request_id, get_request_id(), func, *args)
+        else:
+            task = in_context(func, *args)
+        loop = asyncio.get_running_loop()
+        with INFERENCE_IN_FLIGHT.track_inprogress():
+            return await loop.run_in_executor(InferenceExecutor.executor, task)
+
+    @staticmethod
+    def is_ready() -> bool:
+        return InferenceExecutor.ready
@@ -0,0 +1,50 @@
+"""Export the Keras embedding model of deepface to ONNX.
+
+Usage:
+    python -m face_authentication.inference.export_onnx [--output PATH] [--opset N]
+
+Runs once, offline, on a machine with TensorFlow and tf2onnx installed. The
+exported file is what EMBEDDING_BACKEND=onnx loads; check it against the
+Keras model with python -m benchmarks.onnx_parity before deploying it.
+"""
+import argparse
+import os
+import sys
+
+from face_authentication.constants.embeddings import (
+    EMBEDDING_MODEL_NAME,
+    ONNX_MODEL_PATH,
+)
+from face_authentication.exception import AppException
+from face_authentication.inference.model_registry import ModelRegistry
+from face_authentication.logger import logging
+
+
+def export(output: str = ONNX_MODEL_PATH, opset: int = 13) -> str:
+    try:
+        import tensorflow as tf
+        import tf2onnx
+
+        model = ModelRegistry.build_embedding_model("keras")
+        _, height, width, channels = model.input_shape
+        # A dynamic batch axis, so the micro-batches of any size can be run
+        signature = [
+            tf.TensorSpec((None, height, width, channels), tf.float32, name="faces")
+        ]
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        logging.info(f"Exporting {EMBEDDING_MODEL_NAME} to {output} .......")
+        tf2onnx.convert.from_keras(
+            model, input_signature=signature, opset=opset, output_path=output
+        )
+        logging.info(f"Exported {EMBEDDING_MODEL_NAME} to ONNX.......")
+        return output
+    except Exception as e:
+        raise AppException(e, sys) from e
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=ONNX_MODEL_PATH)
+    parser.add_argument("--opset", type=int, default=13)
+    args = parser.parse_args()
+    print(f"Wrote {export(args.output, args.opset)}")
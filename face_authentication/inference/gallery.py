@@ -0,0 +1,134 @@
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+
+from face_authentication.constants.embeddings import (
+    EMBEDDING_SIZE,
+    GALLERY_SYNC_INTERVAL,
+    GALLERY_SYNC_OVERLAP,
+    IDENTIFICATION_TOP_K,
+    SIMILARITY_THRESHOLD,
+)
+from face_authentication.data_access.user_embedding_data import UserEmbeddingData
+from face_authentication.entity.user_embedding import Embedding
+from face_authentication.exception import AppException
+from face_authentication.logger import logging
+
+
+class EmbeddingGallery:
+    """In-memory gallery of every enrolled embedding for 1:N identification.
+
+    The embeddings are kept L2 normalized in one contiguous
+    (capacity, EMBEDDING_SIZE) float32 matrix so that a search is a single
+    matrix-vector product. New enrolments are appended either directly by
+    ``add`` or by an incremental sync. The sync reads the documents whose
+    server-set updated_at is at most GALLERY_SYNC_OVERLAP seconds older than
+    the newest one seen, as writes of other processes may become visible out
+    of order. Documents read twice are harmless, ``add`` replaces the row of a
+    known user.
+    """
+
+    gallery = None
+    gallery_lock = threading.Lock()
+
+    def __init__(self, sync_interval: float = GALLERY_SYNC_INTERVAL) -> None:
+        self.sync_interval = sync_interval
+        self.matrix = np.empty((1024, EMBEDDING_SIZE), dtype=np.float32)
+        self.user_ids: List[str] = []
+        self.rows = {}
+        self.last_updated = None
+        self.last_sync = None
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    @staticmethod
+    def get_gallery() -> "EmbeddingGallery":
+        """Return the gallery shared by the whole process"""
+        with EmbeddingGallery.gallery_lock:
+            if EmbeddingGallery.gallery is None:
+                EmbeddingGallery.gallery = EmbeddingGallery()
+            return EmbeddingGallery.gallery
+
+    def add(self, user_id: str, embedding) -> None:
+        """Insert or replace the embedding of a user"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / np.linalg.norm(embedding)
+        with self.lock:
+            row = self.rows.get(user_id)
+            if row is None:
+                row = len(self.user_ids)
+                if row == len(self.matrix):
+                    # Grow geometrically so enrolments stay amortized O(1)
+                    matrix = np.empty(
+                        (2 * len(self.matrix), EMBEDDING_SIZE), dtype=np.float32
+                    )
+                    matrix[:row] = self.matrix
+                    self.matrix = matrix
+                self.user_ids.append(user_id)
+                self.rows[user_id] = row
+            self.matrix[row] = embedding
+
+    def sync(self) -> None:
+        """Load the embeddings enrolled since the last sync"""
+        try:
+            with self.sync_lock:
+                since = None
+                if self.last_sync is not None:
+                    # Documents enrolled before updated_at existed are only
+                    # read by the initial load
+                    since = (self.last_updated or datetime(1970, 1, 1)) - timedelta(
+                        seconds=GALLERY_SYNC_OVERLAP
+                    )
+                documents = []
+                for document in UserEmbeddingData().get_embeddings_updated_since(since):
+                    if document.get("user_embed") is not None:
+                        documents.append(
+                            (document["user_id"], Embedding.decode(document))
+                        )
+                    updated_at = document.get("updated_at")
+                    if updated_at is not None and (
+                        self.last_updated is None or updated_at > self.last_updated
+                    ):
+                        self.last_updated = updated_at
+                for user_id, embedding in documents:
+                    self.add(user_id, embedding)
+                self.last_sync = time.monotonic()
+            if documents:
+                logging.info(f"Synced {len(documents)} embeddings to the gallery.......")
+        except Exception as e:
+            raise AppException(e, sys) from e
+
+    def search(
+        self,
+        embedding: np.ndarray,
+        top_k: int = IDENTIFICATION_TOP_K,
+        threshold: float = SIMILARITY_THRESHOLD,
+    ) -> List[dict]:
+        """Return up to top_k users whose similarity is above the threshold,
+        best match first"""
+        if self.last_sync is None or time.monotonic() - self.last_sync > self.sync_interval:
+            self.sync()
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        with self.lock:
+            size = len(self.user_ids)
+            if size == 0:
+                return []
+            user_ids = list(self.user_ids)
+            scores = self.matrix[:size] @ query
+        top_k = min(top_k, size)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [
+            {"user_id": user_ids[row], "similarity": float(scores[row])}
+            for row in candidates
+            if scores[row] >= threshold
+        ]
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
@@ -0,0 +1,143 @@
+import os
+import sys
+from typing import Tuple
+
+import numpy as np
+
+from face_authentication.constants.embeddings import (
+    DETECTOR_CASCADE,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    MODEL_CACHE_DIRECTORY,
+    REDETECTION_BACKEND,
+    WARMUP_IMAGE_SIZE,
+)
+from face_authentication.exception import AppException
+from face_authentication.logger import logging
+from face_authentication.metrics import EMBEDDING_SECONDS
+
+# deepface imports TensorFlow, which costs seconds and hundreds of MB. It is
+# imported inside the functions that need it, so that modules of the
+# inference layer can be imported without loading the ML stack.
+
+
+class ModelRegistry:
+    """Holds the face detector and the embedding model for the whole process.
+
+    The models are built once by ``load`` (called from the app startup) and
+    shared by every request afterwards. Nothing of deepface is imported
+    before the first model is built.
+    """
+
+    detectors = {}
+    embedding_model = None
+    ready = False
+    model_directory_ready = False
+
+    @staticmethod
+    def prepare_model_directory() -> None:
+        """Create MODEL_CACHE_DIRECTORY and point deepface at it. deepface
+        resolves its weights directory from DEEPFACE_HOME, so this runs
+        before anything of deepface is imported, and only then, so that
+        importing the app leaves the file system alone."""
+        if ModelRegistry.model_directory_ready:
+            return
+        os.makedirs(MODEL_CACHE_DIRECTORY, exist_ok=True)
+        os.environ.setdefault("DEEPFACE_HOME", MODEL_CACHE_DIRECTORY)
+        ModelRegistry.model_directory_ready = True
+
+    def load(self) -> None:
+        """Build the detector and the embedding model and warm them up"""
+        try:
+            if ModelRegistry.ready:
+                return
+            for backend in dict.fromkeys(DETECTOR_CASCADE + [REDETECTION_BACKEND]):
+                logging.info(f"Building the {backend} face detector .......")
+                ModelRegistry.get_detector(backend)
+
+            logging.info(
+                f"Building the {EMBEDDING_MODEL_NAME} embedding model on "
+                f"{EMBEDDING_BACKEND} ......."
+            )
+            ModelRegistry.get_embedding_model()
+
+            self.warm_up()
+            ModelRegistry.ready = True
+            logging.info("Models loaded and warmed up.......")
+        except Exception as e:
+            raise AppException(e, sys) from e
+
+    def warm_up(self) -> None:
+        """Run one detection and one embedding on a synthetic image so the
+        first real request does not pay for graph tracing and allocation"""
+        ModelRegistry.prepare_model_directory()
+        from deepface.detectors import FaceDetector
+
+        logging.info("Warming up the models .......")
+        rng = np.random.default_rng(0)
+        img_array = rng.integers(
+            0, 256, size=(WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8
+        )
+        for backend in DETECTOR_CASCADE:
+            FaceDetector.detect_faces(
+                ModelRegistry.get_detector(backend), backend, img_array, align=True
+            )
+        height, width = ModelRegistry.get_input_shape()
+        ModelRegistry.embedding_model.predict_on_batch(
+            np.zeros((1, height, width, 3), dtype=np.float32)
+        )
+
+    @staticmethod
+    def get_detector(backend: str):
+        """Return the shared face detector of a deepface backend"""
+        if backend not in ModelRegistry.detectors:
+            ModelRegistry.prepare_model_directory()
+            from deepface.detectors import FaceDetector
+
+            ModelRegistry.detectors[backend] = FaceDetector.build_model(backend)
+        return ModelRegistry.detectors[backend]
+
+    @staticmethod
+    def get_embedding_model():
+        """Return the shared embedding model, building it if the registry was
+        never loaded (e.g. outside the web app)"""
+        if ModelRegistry.embedding_model is None:
+            ModelRegistry.embedding_model = ModelRegistry.build_embedding_model()
+        return ModelRegistry.embedding_model
+
+    @staticmethod
+    def build_embedding_model(backend: str = EMBEDDING_BACKEND):
+        """Build the embedding model on the given engine, "keras" or "onnx".
+        Both expose input_shape and predict_on_batch."""
+        if backend == "keras":
+            ModelRegistry.prepare_model_directory()
+            from deepface import DeepFace
+
+            return DeepFace.build_model(EMBEDDING_MODEL_NAME)
+        if backend == "onnx":
+            from face_authentication.inference.onnx_model import OnnxEmbeddingModel
+
+            return OnnxEmbeddingModel()
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    @staticmethod
+    def get_input_shape() -> Tuple[int, int]:
+        """Height and width of the faces expected by the embedding model"""
+        _, height, width, _ = ModelRegistry.get_embedding_model().input_shape
+        return height, width
+
+    @staticmethod
+    def embed(faces: np.ndarray) -> np.ndarray:
+        """Run the embedding model once over a stack of preprocessed faces
+        Args:
+            faces (np.ndarray): Faces of shape (N, height, width, 3)
+        Returns:
+            np.ndarray: Embeddings of shape (N, EMBEDDING_SIZE)
+        """
+        model = ModelRegistry.get_embedding_model()
+        with EMBEDDING_SECONDS.time():
+            return np.asarray(model.predict_on_batch(faces), dtype=np.float32)
+
+    @staticmethod
+    def is_ready() -> bool:
+        return ModelRegistry.ready
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+from face_authentication.constants.embeddings import (
+    ONNX_INTRA_OP_THREADS,
+    ONNX_MODEL_PATH,
+)
+
+
+class OnnxEmbeddingModel:
+    """The embedding model exported to ONNX, run by ONNX Runtime on the CPU.
+
+    Exposes ``input_shape`` and ``predict_on_batch`` like the Keras model, so
+    ModelRegistry can hand out either one.
+    """
+
+    def __init__(
+        self, path: str = ONNX_MODEL_PATH, intra_op_threads: int = ONNX_INTRA_OP_THREADS
+    ) -> None:
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=onnx needs onnxruntime: pip install onnxruntime"
+            ) from e
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found, export it first with "
+                "python -m face_authentication.inference.export_onnx"
+            )
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        # A single stack of faces per call, nothing to run in parallel
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    @property
+    def input_shape(self) -> tuple:
+        """Shape of the model input as (batch, height, width, channels)"""
+        return tuple(self.session.get_inputs()[0].shape)
+
+    def predict_on_batch(self, faces: np.ndarray) -> np.ndarray:
+        faces = np.ascontiguousarray(faces, dtype=np.float32)
+        return self.session.run([self.output_name], {self.input_name: faces})[0]
@@ -0,0 +1,113 @@
+import io
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from face_authentication.constants.embeddings import (
+    DETECTION_MAX_SIDE,
+    PRECROPPED_BRIGHTNESS_RANGE,
+    PRECROPPED_MIN_CONTRAST,
+)
+
+
+class InvalidFaceCrop(ValueError):
+    """A pre-cropped upload that cannot be embedded without detection"""
+
+
+def decode_image(contents: bytes, max_side: int = DETECTION_MAX_SIDE) -> np.ndarray:
+    """Decode uploaded image bytes into an RGB array ready for detection
+    Args:
+        contents (bytes): Raw bytes of the uploaded image
+        max_side (int): Longest side of the returned image
+    Returns:
+        np.ndarray: Contiguous uint8 array of shape (height, width, 3)
+    """
+    img = Image.open(io.BytesIO(contents))
+    # JPEG can be decoded at 1/2, 1/4 or 1/8 scale, which skips most of the
+    # work for large camera frames. The size is square so that it holds
+    # whatever the EXIF orientation turns out to be.
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(img)
+
+
+def resize_face(face: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
+    """Fit a face crop into the model input the way deepface does: scale it
+    to fit, pad the rest with black and add the batch axis
+    Args:
+        face (np.ndarray): Face crop of shape (height, width, 3)
+        target_size (Tuple[int, int]): Height and width of the model input
+    Returns:
+        np.ndarray: float32 array of shape (1, height, width, 3) in [0, 1]
+    """
+    import cv2
+
+    height, width = target_size
+    factor = min(height / face.shape[0], width / face.shape[1])
+    size = (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor)))
+    face = cv2.resize(face, size)
+    pad_height = height - face.shape[0]
+    pad_width = width - face.shape[1]
+    face = np.pad(
+        face,
+        (
+            (pad_height // 2, pad_height - pad_height // 2),
+            (pad_width // 2, pad_width - pad_width // 2),
+            (0, 0),
+        ),
+        "constant",
+    )
+    if face.shape[:2] != (height, width):
+        face = cv2.resize(face, (width, height))
+    return face[np.newaxis].astype(np.float32) / 255
+
+
+def decode_face_crop(contents: bytes, target_size: Tuple[int, int]) -> np.ndarray:
+    """Decode a pre-cropped upload at its own size, refusing other sizes
+    before any pixel is decoded
+    Args:
+        contents (bytes): Raw bytes of the uploaded image
+        target_size (Tuple[int, int]): Height and width of the model input
+    Returns:
+        np.ndarray: Contiguous uint8 RGB array of shape (height, width, 3)
+    """
+    img = Image.open(io.BytesIO(contents))
+    # Only the header has been read so far. Sorted, as the EXIF orientation
+    # may still swap the sides.
+    if sorted(img.size) != sorted(target_size):
+        raise InvalidFaceCrop(
+            f"Pre-cropped faces must be {target_size[1]}x{target_size[0]}, "
+            f"got {img.size[0]}x{img.size[1]}"
+        )
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img)
+
+
+def check_face_crop(img_array: np.ndarray, target_size: Tuple[int, int]) -> None:
+    """Reject pre-cropped uploads of the wrong size or that cannot hold a face
+    Args:
+        img_array (np.ndarray): Decoded upload of shape (height, width, 3)
+        target_size (Tuple[int, int]): Height and width of the model input
+    Raises:
+        InvalidFaceCrop: When the size or the exposure is off
+    """
+    if img_array.shape[:2] != tuple(target_size):
+        raise InvalidFaceCrop(
+            f"Pre-cropped faces must be {target_size[1]}x{target_size[0]}, "
+            f"got {img_array.shape[1]}x{img_array.shape[0]}"
+        )
+    # Subsampled, the statistics hardly change and cost a quarter
+    pixels = img_array[::2, ::2].astype(np.float32)
+    low, high = PRECROPPED_BRIGHTNESS_RANGE
+    if not low <= pixels.mean() <= high:
+        raise InvalidFaceCrop("Pre-cropped face is under or over exposed")
+    if pixels.std() < PRECROPPED_MIN_CONTRAST:
+        raise InvalidFaceCrop("Pre-cropped face has no contrast")
+
@@ -0,0 +1,51 @@
+from typing import List
+
+import numpy as np
+
+from face_authentication.inference.embedding_cache import UploadedFace
+from face_authentication.inference.gallery import EmbeddingGallery
+from face_authentication.validation.user_embedding import (
+    UserLoginEmbeddingValidation,
+    UserRegisterEmbeddingValidation,
+)
+
+
+# Module level functions so that they can be pickled into a process pool
+
+
+def extract_face(contents: bytes) -> UploadedFace:
+    """Decode one uploaded image and extract its preprocessed face"""
+    return UserLoginEmbeddingValidation.extract_face_from_bytes(contents)
+
+
+def extract_precropped_face(contents: bytes) -> UploadedFace:
+    """Decode and check one uploaded face crop, without detection"""
+    return UserLoginEmbeddingValidation.extract_precropped_face_from_bytes(contents)
+
+
+def embed_faces(faces: List[UploadedFace]) -> np.ndarray:
+    """Embed the extracted faces that are not cached in one batch"""
+    return UserLoginEmbeddingValidation.generate_face_embeddings(faces)
+
+
+def compare_faces(user_id: str, faces: List[UploadedFace]) -> dict:
+    """Compare the extracted faces against the stored embedding of the user
+    and report how many of them had to be processed"""
+    user_embedding_validation = UserLoginEmbeddingValidation(user_id)
+    status = user_embedding_validation.compare_faces(faces)
+    return {
+        "status": status,
+        "frames_processed": user_embedding_validation.frames_processed,
+    }
+
+
+def save_faces(user_id: str, faces: List[UploadedFace]) -> None:
+    """Store the embedding of the extracted faces for the user"""
+    UserRegisterEmbeddingValidation(user_id).save_faces(faces)
+
+
+def identify(faces: List[UploadedFace], top_k: int) -> List[dict]:
+    """Find the enrolled users that match the extracted faces"""
+    embedding_list = UserLoginEmbeddingValidation.generate_face_embeddings(faces)
+    avg_embedding = UserLoginEmbeddingValidation.average_embedding(embedding_list)
+    return EmbeddingGallery.get_gallery().search(avg_embedding, top_k)
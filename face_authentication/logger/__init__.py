@@ -1,26 +1,130 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
-from datetime import datetime
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from functools import partial
+from typing import Optional
 
-# Creating logs directory to store log in files
-LOG_DIRECTORY = "logs"
-LOG_DIRECTORY = os.path.join(os.getcwd(), LOG_DIRECTORY)
+from face_authentication.constants.logger import (
+    LOG_BACKUP_COUNT,
+    LOG_DESTINATION,
+    LOG_DIRECTORY,
+    LOG_FILE_NAME,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+)
 
-# Creating LOG_DIRECTORY if it does not exists.
-os.makedirs(LOG_DIRECTORY, exist_ok=True)
+# Id of the request being served and the seconds spent in each of its stages
+request_id_var = contextvars.ContextVar("request_id", default=None)
+stages_var = contextvars.ContextVar("stages", default=None)
+# Threads of the same request share its stage dict
+stages_lock = threading.Lock()
 
 
-# Creating file name for log file based on current timestamp
-CURRENT_TIME_STAMP = f"{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}"
-file_name = f"log_{CURRENT_TIME_STAMP}.log"
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
 
-# Creating file path for projects.
-log_file_path = os.path.join(LOG_DIRECTORY, file_name)
 
+def start_request(request_id: str) -> None:
+    """Bind a request id and a fresh stage timing dict to the current context"""
+    request_id_var.set(request_id)
+    stages_var.set({})
 
-logging.basicConfig(
-    filename=log_file_path,
-    filemode="w",
-    format="[%(asctime)s] %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
\ No newline at end of file
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add the duration of a stage to the request of the current context"""
+    stages = stages_var.get()
+    if stages is not None:
+        with stages_lock:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def get_stages() -> dict:
+    """Stage durations of the current request in milliseconds"""
+    stages = stages_var.get() or {}
+    with stages_lock:
+        stages = dict(stages)
+    return {stage: round(1000 * seconds, 3) for stage, seconds in stages.items()}
+
+
+def in_context(func, *args):
+    """Wrap func(*args) to run in a copy of the current context, so that work
+    handed to a thread pool keeps the request id and records its stages"""
+    return partial(contextvars.copy_context().run, func, *args)
+
+
+def run_with_request_id(request_id: Optional[str], func, *args):
+    """Entry point of tasks sent to worker processes, where the context of the
+    caller cannot follow"""
+    start_request(request_id)
+    return func(*args)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread after binding the request id.
+
+    Only the message and the traceback are rendered on the calling thread,
+    the JSON encoding and the disk write happen in the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.request_id = get_request_id()
+        return record
+
+
+log_queue = queue.SimpleQueue()
+
+# Only a process no other Python process started can be the single writer
+# of the file. The name is set before a spawned child imports anything.
+is_main_process = multiprocessing.current_process().name == "MainProcess"
+if LOG_DESTINATION == "file" and is_main_process:
+    # Creating LOG_DIRECTORY if it does not exists.
+    LOG_DIRECTORY = os.path.join(os.getcwd(), LOG_DIRECTORY)
+    os.makedirs(LOG_DIRECTORY, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIRECTORY, LOG_FILE_NAME),
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+    )
+else:
+    handler = logging.StreamHandler(sys.stderr)
+handler.setFormatter(JsonFormatter())
+
+listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+logging.basicConfig(handlers=[ContextQueueHandler(log_queue)], level=LOG_LEVEL)
@@ -0,0 +1,109 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from face_authentication.logger import record_stage
+
+# Sub-millisecond buckets for the pure numpy stages
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+
+# Requests
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests per route",
+    ("method", "route", "status"),
+)
+
+# Face pipeline stages
+
+DECODE_SECONDS = Histogram("face_decode_seconds", "Time to decode an uploaded image")
+DETECTION_SECONDS = Histogram(
+    "face_detection_seconds", "Time to detect and crop the face of one image"
+)
+EMBEDDING_SECONDS = Histogram(
+    "face_embedding_seconds", "Time of one batched embedding model call"
+)
+SIMILARITY_SECONDS = Histogram(
+    "face_similarity_seconds",
+    "Time to compare an embedding with the stored one",
+    buckets=FAST_BUCKETS,
+)
+DETECTION_FAILURES = Counter(
+    "face_detection_failures_total", "Images in which no detector found a face"
+)
+DETECTOR_RUNS = Counter(
+    "face_detector_runs_total",
+    "Runs of every detector of the cascade and whether it produced the face",
+    ("backend", "outcome"),
+)
+VERIFICATION_DECISIONS = Counter(
+    "face_verification_decisions_total",
+    "Face verifications by result",
+    ("result",),
+)
+PRECROPPED_FACES = Counter(
+    "face_precropped_uploads_total",
+    "Pre-cropped uploads that skipped detection, by sanity check result",
+    ("result",),
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total",
+    "Lookups of uploaded images in the embedding cache by store and result",
+    ("store", "result"),
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups of the named in-process caches by cache and result",
+    ("cache", "result"),
+)
+# Gauges are summed over the live processes in multiprocess mode
+INFERENCE_IN_FLIGHT = Gauge(
+    "inference_in_flight",
+    "Inference tasks submitted to the executor and not done",
+    multiprocess_mode="livesum",
+)
+EMBEDDING_BATCHER_QUEUE_DEPTH = Gauge(
+    "embedding_batcher_queue_depth",
+    "Faces waiting for the next embedding batch",
+    multiprocess_mode="livesum",
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Faces per embedding batch flushed by the batcher",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# Database
+
+DB_OPERATION_SECONDS = Histogram(
+    "db_operation_seconds", "Round trip time of the Mongo commands", ("command",)
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled Mongo connection"
+)
+DB_CHECKOUT_FAILURES = Counter(
+    "db_checkout_failures_total", "Failed checkouts of a pooled Mongo connection"
+)
+
+# Passwords
+
+PASSWORD_HASH_SECONDS = Histogram("password_hash_seconds", "Time to hash a password")
+PASSWORD_VERIFY_SECONDS = Histogram(
+    "password_verify_seconds", "Time to verify a password against its hash"
+)
+
+
+@contextmanager
+def timed(stage: str, histogram: Histogram = None):
+    """Time the with block into the histogram and the stage durations that are
+    logged with the request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if histogram is not None:
+            histogram.observe(seconds)
+        record_stage(stage, seconds)
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from face_authentication.metrics import CACHE_LOOKUPS
+
+
+class LRUCache:
+    """Thread safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    A cache with a ``name`` counts its hits and misses in cache_lookups_total.
+    """
+
+    def __init__(
+        self, max_size: int, ttl: Optional[float] = None, name: Optional[str] = None
+    ) -> None:
+        self.max_size = max_size
+        self.name = name
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value or None if it is missing or expired"""
+        value = self._get(key)
+        if self.name is not None:
+            CACHE_LOOKUPS.labels(
+                cache=self.name, result="miss" if value is None else "hit"
+            ).inc()
+        return value
+
+    def _get(self, key: Hashable) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -3,13 +3,16 @@ from dotenv import dotenv_values
 
 class CommonUtils:
 
-    def get_environment_variable(self, variable_name: str):
+    def get_environment_variable(self, variable_name: str, default=None):
         """
         :param variable_name:
+        :param default: value returned when the variable is not set anywhere
         :return environment variable:
         """
         if os.environ.get(variable_name) is None:
             enironment_variable = dotenv_values(".env")
+            if default is not None:
+                return enironment_variable.get(variable_name) or default
             return enironment_variable[variable_name]
         else:
-            return os.environ.get(variable_name)
\ No newline at end of file
+            return os.environ.get(variable_name)
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from face_authentication.constants.auth import (
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_WORKERS,
+)
+from face_authentication.logger import in_context
+from face_authentication.metrics import (
+    PASSWORD_HASH_SECONDS,
+    PASSWORD_VERIFY_SECONDS,
+    timed,
+)
+
+# min and max rounds make hashes of any other cost report that they need an update
+bcrypt_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashingBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt releases the GIL, so the event loop stays responsive, and the
+    bounded number of pending calls keeps a burst of logins from queueing
+    unbounded CPU work in front of the face verification traffic.
+    """
+
+    executor = ThreadPoolExecutor(
+        max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+    )
+    pending = 0
+
+    async def _run(self, func, *args):
+        # Only touched from the event loop thread, so no lock is needed
+        if PasswordHasher.pending >= PASSWORD_HASH_MAX_PENDING:
+            raise PasswordHashingBusy("Too many password operations in progress")
+        PasswordHasher.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                PasswordHasher.executor, in_context(func, *args)
+            )
+        finally:
+            PasswordHasher.pending -= 1
+
+    @staticmethod
+    def _hash(password: str) -> str:
+        with timed("password_hash", PASSWORD_HASH_SECONDS):
+            return bcrypt_context.hash(password)
+
+    @staticmethod
+    def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        with timed("password_verify", PASSWORD_VERIFY_SECONDS):
+            return bcrypt_context.verify_and_update(password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(PasswordHasher._hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Verify the password and return a new hash when the stored one was
+        made with an outdated cost"""
+        return await self._run(
+            PasswordHasher._verify_and_update, password, hashed_password
+        )
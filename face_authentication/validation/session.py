@@ -0,0 +1,85 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from jose import JWTError, jwt
+
+from face_authentication.constants.auth import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    ALGORITHM,
+    SECRET_KEY,
+    SESSION_REVOCATION_CACHE_SIZE,
+    SESSION_REVOCATION_CHECK_TTL,
+)
+from face_authentication.data_access.revoked_token_data import AsyncRevokedTokenData
+from face_authentication.logger import logging
+from face_authentication.utilities.cache import LRUCache
+
+
+class SessionValidation:
+    """Signed session tokens that are verified without reading the user.
+
+    The token carries the user_id and username of the logged in user. Logging
+    out stores its id in a collection shared by every worker, whose TTL index
+    drops it once the token has expired anyway. The process caches the
+    answers of that collection: a revoked token until it expires, a valid one
+    for SESSION_REVOCATION_CHECK_TTL seconds.
+    """
+
+    revoked = LRUCache(
+        SESSION_REVOCATION_CACHE_SIZE,
+        ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        name="revoked_sessions",
+    )
+    valid = LRUCache(
+        SESSION_REVOCATION_CACHE_SIZE, SESSION_REVOCATION_CHECK_TTL, name="valid_sessions"
+    )
+
+    @staticmethod
+    def create_token(user_id: str, username: str) -> str:
+        """Issue a signed token for a successfully authenticated user"""
+        payload = {
+            "user_id": user_id,
+            "username": username,
+            "jti": uuid.uuid4().hex,
+            "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+        }
+        return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+    @staticmethod
+    def decode_token(token: str) -> Optional[dict]:
+        """Return the payload of a token, None if it is forged or expired"""
+        try:
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            logging.info("Invalid session token.......")
+            return None
+
+    @staticmethod
+    async def verify_token(token: str) -> Optional[dict]:
+        """Return the payload of a valid token, None if the token is forged,
+        expired or was logged out"""
+        payload = SessionValidation.decode_token(token)
+        if payload is None:
+            return None
+        jti = payload.get("jti")
+        if SessionValidation.revoked.get(jti) is not None:
+            return None
+        if SessionValidation.valid.get(jti) is None:
+            if await AsyncRevokedTokenData().is_revoked(jti):
+                SessionValidation.revoked.set(jti, True)
+                return None
+            SessionValidation.valid.set(jti, True)
+        return payload
+
+    @staticmethod
+    async def revoke_token(token: str) -> None:
+        """Invalidate the session of a token in every worker"""
+        payload = SessionValidation.decode_token(token)
+        if payload is None:
+            return
+        await AsyncRevokedTokenData().revoke(
+            payload["jti"], datetime.utcfromtimestamp(payload["exp"])
+        )
+        SessionValidation.revoked.set(payload["jti"], True)
+        SessionValidation.valid.invalidate(payload["jti"])
@@ -2,14 +2,13 @@ import re
 import sys
 from typing import Optional
 
-from passlib.context import CryptContext
+from pymongo.errors import DuplicateKeyError
 
-from face_authentication.data_access.user_data import UserData
+from face_authentication.data_access.user_data import AsyncUserData
 from face_authentication.entity.user import User
 from face_authentication.exception import AppException
 from face_authentication.logger import logging
-
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from face_authentication.validation.password import PasswordHasher, PasswordHashingBusy
 
 
 class LoginValidation:
@@ -22,6 +21,7 @@ class LoginValidation:
         """
         self.email_id = email_id
         self.password = password
+        self.new_password_hash = None
         self.regex = re.compile(
             r"([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+"
         )
@@ -50,15 +50,19 @@ class LoginValidation:
         else:
             return False
 
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify hashed password and plain password.
+        Keeps the new hash in new_password_hash when the stored one uses an outdated cost.
         Args:
             plain_password (str): _description_
             hashed_password (str): _description_
         Returns:
             bool: _description_
         """
-        return bcrypt_context.verify(plain_password, hashed_password)
+        verified, self.new_password_hash = await PasswordHasher().verify_and_update(
+            plain_password, hashed_password
+        )
+        return verified
 
     def validate_login(self) -> dict:
 
@@ -67,7 +71,7 @@ class LoginValidation:
             return {"status": False, "msg": self.validate()}
         return {"status": True}
 
-    def authenticate_user_login(self) -> Optional[str]:
+    async def authenticate_user_login(self) -> Optional[str]:
         """This authenticates the user and returns the token if the user is authenticated
         Args:
             email_id (str): _description_
@@ -77,18 +81,26 @@ class LoginValidation:
 
             logging.info("Authenticating the user details.....")
             if self.validate_login()["status"]:
-                userdata = UserData()
+                userdata = AsyncUserData()
                 logging.info("Fetching the user details from the database.....")
-                user_details = userdata.get_user({"email_id": self.email_id})
+                user_details = await userdata.get_user({"email_id": self.email_id})
                 if not user_details:
                     logging.info("User not found!")
                     return False
-                if not self.verify_password(self.password, user_details["password"]):
+                if not await self.verify_password(self.password, user_details["password"]):
                     logging.info("Password is incorrect")
                     return False
+                if self.new_password_hash is not None:
+                    logging.info("Rehashing the password with the current cost.....")
+                    await userdata.update_user(
+                        {"email_id": self.email_id},
+                        {"password": self.new_password_hash},
+                    )
                 logging.info("User authenticated successfully....")
                 return user_details
             return False
+        except PasswordHashingBusy:
+            raise
         except Exception as e:
             raise AppException(e, sys) from e
 
@@ -104,12 +116,13 @@ class RegisterValidation:
                 r"([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+"
             )
             self.uuid = self.user.uuid_
-            self.userdata = UserData()
-            self.bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+            self.userdata = AsyncUserData()
+            # Result of validate_registration, so one request validates once
+            self.validation_status = None
         except Exception as e:
             raise e
 
-    def validate(self) -> bool:
+    async def validate(self) -> bool:
 
         """This checks all the validation conditions for the user registration
         Returns:
@@ -139,7 +152,7 @@ class RegisterValidation:
             if not self.is_password_valid():
                 msg += "Length of the pass`word should be between 8 and 16"
 
-            if not self.is_details_exists():
+            if not await self.is_details_exists():
                 msg += "User already exists"
 
             return msg
@@ -162,27 +175,39 @@ class RegisterValidation:
         else:
             return False
 
-    def is_details_exists(self) -> bool:
-        username_val = self.userdata.get_user({"username": self.user.username})
-        emailid_val = self.userdata.get_user({"email_id": self.user.email_id})
-        uuid_val = self.userdata.get_user({"UUID": self.uuid})
-        if username_val == None and emailid_val == None and uuid_val == None:
+    async def is_details_exists(self) -> bool:
+        """Single round trip check for an existing user. The unique indexes
+        still decide when two registrations race past this check."""
+        existing_user = await self.userdata.get_user(
+            {
+                "$or": [
+                    {"username": self.user.username},
+                    {"email_id": self.user.email_id},
+                    {"uuid": self.uuid},
+                ]
+            }
+        )
+        if existing_user == None:
             return True
         return False
 
     @staticmethod
-    def get_password_hash(password: str) -> str:
-        return bcrypt_context.hash(password)
+    async def get_password_hash(password: str) -> str:
+        return await PasswordHasher().hash(password)
 
-    def validate_registration(self) -> bool:
+    async def validate_registration(self) -> bool:
 
         """This checks all the validation conditions for the user registration
         """
-        if len(self.validate()) != 0:
-            return {"status": False, "msg": self.validate()}
-        return {"status": True}
-
-    def authenticate_user_registration(self) -> bool:
+        if self.validation_status is None:
+            msg = await self.validate()
+            if len(msg) != 0:
+                self.validation_status = {"status": False, "msg": msg}
+            else:
+                self.validation_status = {"status": True}
+        return self.validation_status
+
+    async def authenticate_user_registration(self) -> bool:
         """_summary_: This saves the user details in the database
         only after validating the user details
         Returns:
@@ -190,9 +215,10 @@ class RegisterValidation:
         """
         try:
             logging.info("Validating the user details while Registration.....")
-            if self.validate_registration()["status"]:
+            validation_status = await self.validate_registration()
+            if validation_status["status"]:
                 logging.info("Generating the password hash.....")
-                hashed_password: str = self.get_password_hash(self.user.password)
+                hashed_password: str = await self.get_password_hash(self.user.password)
                 user_data_dict: dict = {
                     "name": self.user.name,
                     "username": self.user.username,
@@ -202,10 +228,14 @@ class RegisterValidation:
                     "uuid": self.uuid,
                 }
                 logging.info("Saving the user details in the database.....")
-                self.userdata.save_user(user_data_dict)
+                try:
+                    await self.userdata.save_user(user_data_dict)
+                except DuplicateKeyError:
+                    logging.info("User already exists.....")
+                    return {"status": False, "msg": "User already exists"}
                 logging.info("Saving the user details in the database completed.....")
                 return {"status": True, "msg": "User registered successfully"}
             logging.info("Validation failed while Registration.....")
-            return {"status": False, "msg": self.validate()}
+            return validation_status
         except Exception as e:
             raise 
\ No newline at end of file
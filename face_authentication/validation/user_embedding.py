@@ -1,102 +1,341 @@
-import io
 import sys
 from ast import Bytes
-from typing import List
+from typing import Iterable, List, Tuple
 
 import numpy as np
-from deepface import DeepFace
-from deepface.commons.functions import detect_face
-from PIL import Image
 
 from face_authentication.constants.embeddings import (
-    DETECTOR,
-    EMBEDDING_MODEL_NAME,
-    ENFORCE_DETECTION,
+    EARLY_EXIT_MARGIN,
+    EARLY_EXIT_MIN_FRAMES,
+    EARLY_EXIT_VERIFICATION,
+    EMBEDDING_BATCHING,
+    MAX_TEMPLATES_PER_USER,
     SIMILARITY_THRESHOLD,
+    TEMPLATE_DUPLICATE_SIMILARITY,
+    TEMPLATE_UPDATE_ATTEMPTS,
+    TEMPLATE_FUSION,
+    TEMPLATE_FUSION_TOP_K,
+    TEMPLATE_UPDATE_THRESHOLD,
 )
 from face_authentication.data_access.user_embedding_data import UserEmbeddingData
 from face_authentication.exception import AppException
+from face_authentication.inference.batcher import EmbeddingBatcher
+from face_authentication.inference.detector import DetectorCascade
+from face_authentication.inference.embedding_cache import EmbeddingCache, UploadedFace
+from face_authentication.inference.gallery import EmbeddingGallery
+from face_authentication.inference.model_registry import ModelRegistry
+from face_authentication.inference.preprocessing import (
+    InvalidFaceCrop,
+    check_face_crop,
+    decode_face_crop,
+    decode_image,
+    resize_face,
+)
 from face_authentication.logger import logging
+from face_authentication.metrics import (
+    DECODE_SECONDS,
+    DETECTION_SECONDS,
+    PRECROPPED_FACES,
+    SIMILARITY_SECONDS,
+    VERIFICATION_DECISIONS,
+    timed,
+)
 
 
 class UserLoginEmbeddingValidation:
     def __init__(self, user_id: str) -> None:
         self.user_id = user_id
         self.user_embedding_data = UserEmbeddingData()
-        self.user = self.user_embedding_data.get_user_embedding(user_id)
+        # Served from the in-process cache on repeat logins
+        self.user = None
+        stored = self.user_embedding_data.get_user_templates(user_id)
+        if stored is not None:
+            self.user = {"user_id": user_id}
+            self.user["user_templates"], self.user["template_version"] = stored
+        self.frames_processed = 0
+        self.embedding_sum = None
+        # Mean embedding of the login frames and its score against every
+        # template, kept to update the templates without embedding again
+        self.probe_embedding = None
+        self.template_scores = None
 
     def validate(self) -> bool:
         try:
-            if self.user["user_id"] == None:
+            if self.user["user_id"] is None:
                 return False
-            if self.user["user_embed"] == None:
+            if self.user["user_templates"] is None:
                 return False
             return True
         except Exception as e:
             raise e
 
+    @staticmethod
+    def extract_face(img_array: np.ndarray) -> np.ndarray:
+        """Detect the face in an image array and return it resized and
+        normalized to the input shape of the embedding model
+        Args:
+            img_array (np.ndarray): Image array
+        Returns:
+            np.ndarray: Face of shape (1, height, width, 3)
+        """
+        try:
+            with timed("detection", DETECTION_SECONDS):
+                face = DetectorCascade.get_cascade().detect(img_array)
+                # The second detection of DeepFace.represent, which every
+                # stored enrolment went through
+                face = DetectorCascade.redetect(face)
+            # Same resize and scaling as deepface, without importing it, so
+            # the ONNX backend never needs TensorFlow for preprocessing
+            return resize_face(face, ModelRegistry.get_input_shape())
+        except Exception as e:
+            raise AppException(e, sys) from e
+
+    @staticmethod
+    def generate_embeddings(faces: np.ndarray) -> np.ndarray:
+        """Embed a stack of preprocessed faces with a single model call
+        Args:
+            faces (np.ndarray): Faces of shape (N, height, width, 3)
+        Returns:
+            np.ndarray: Embeddings of shape (N, EMBEDDING_SIZE)
+        """
+        try:
+            # Includes the wait for the batch, unlike the model call histogram
+            with timed("embedding"):
+                if EMBEDDING_BATCHING:
+                    # Share the forward pass with the other requests in flight
+                    return EmbeddingBatcher.get_batcher().embed(faces)
+                return ModelRegistry.embed(faces)
+        except Exception as e:
+            raise AppException(e, sys) from e
+
     @staticmethod
     def generate_embedding(img_array: np.ndarray) -> np.ndarray:
        
         """ Generate embedding from image array """
         try:
-            faces = detect_face(
-                img_array,
-                detector_backend=DETECTOR,
-                enforce_detection=ENFORCE_DETECTION,
-            )
-            # Generate embedding from face
-            embedding = DeepFace.represent(
-                img_path=faces[0],
-                model_name=EMBEDDING_MODEL_NAME,
-                enforce_detection=False,
-            )
-            return embedding
+            face = UserLoginEmbeddingValidation.extract_face(img_array)
+            return UserLoginEmbeddingValidation.generate_embeddings(face)[0]
         except Exception as e:
             raise AppException(e, sys) from e
 
     @staticmethod
-    def generate_embedding_list(files: List[Bytes]) -> List[np.ndarray]:
+    def extract_face_from_bytes(contents: Bytes) -> UploadedFace:
+        """Decode uploaded image bytes and extract the preprocessed face, or
+        return the cached embedding when the same bytes were seen before"""
+        cache = EmbeddingCache.get_cache()
+        key = cache.key(contents)
+        embedding = cache.get(key)
+        if embedding is not None:
+            return UploadedFace(key, embedding=embedding)
+        # Decode at detection resolution
+        with timed("decode", DECODE_SECONDS):
+            img_array = decode_image(contents)
+        # Detect faces
+        return UploadedFace(key, face=UserLoginEmbeddingValidation.extract_face(img_array))
+
+    @staticmethod
+    def extract_precropped_face_from_bytes(contents: Bytes) -> UploadedFace:
+        """Decode an upload that the client already cropped and aligned to the
+        model input, check it and hand it to the embedding model without
+        running detection
+        Raises:
+            InvalidFaceCrop: When the upload fails the size or sanity check
+        """
+        cache = EmbeddingCache.get_cache()
+        key = cache.key(contents, pre_cropped=True)
+        embedding = cache.get(key)
+        if embedding is not None:
+            return UploadedFace(key, embedding=embedding)
+        target_size = ModelRegistry.get_input_shape()
+        try:
+            with timed("decode", DECODE_SECONDS):
+                img_array = decode_face_crop(contents, target_size)
+            check_face_crop(img_array, target_size)
+        except InvalidFaceCrop:
+            PRECROPPED_FACES.labels(result="rejected").inc()
+            raise
+        PRECROPPED_FACES.labels(result="accepted").inc()
+        return UploadedFace(key, face=resize_face(img_array, target_size))
+
+    @staticmethod
+    def generate_face_embeddings(faces: List[UploadedFace]) -> np.ndarray:
+        """ Embed every extracted face that is not cached in one forward pass
+        Args:
+            faces (List[UploadedFace]): Faces returned by extract_face_from_bytes
+        Returns:
+            np.ndarray: Embeddings of shape (N, EMBEDDING_SIZE), in input order
+        """
+        missing = [face for face in faces if face.embedding is None]
+        if missing:
+            embeddings = UserLoginEmbeddingValidation.generate_embeddings(
+                np.concatenate([face.face for face in missing])
+            )
+            cache = EmbeddingCache.get_cache()
+            for face, embedding in zip(missing, embeddings):
+                face.embedding = embedding
+                face.face = None
+                cache.set(face.key, embedding)
+        return np.stack([face.embedding for face in faces])
+
+    @staticmethod
+    def generate_embedding_list(files: List[Bytes]) -> np.ndarray:
         
-        """ Generate embedding list from image array """
-        embedding_list = []
-        for contents in files:
-            img = Image.open(io.BytesIO(contents))
-            # read image array
-            img_array = np.array(img)
-            # Detect faces
-            embedding = UserLoginEmbeddingValidation.generate_embedding(img_array)
-            embedding_list.append(embedding)
-        return embedding_list
+        """ Generate embeddings of shape (N, EMBEDDING_SIZE) from image bytes """
+        faces = [
+            UserLoginEmbeddingValidation.extract_face_from_bytes(contents)
+            for contents in files
+        ]
+        return UserLoginEmbeddingValidation.generate_face_embeddings(faces)
 
     @staticmethod
-    def average_embedding(embedding_list: List[np.ndarray]) -> List:
+    def average_embedding(embedding_list: np.ndarray) -> np.ndarray:
         """Function to calculate the average embedding of the list of embeddings
         Args:
-            embedding_list (List[np.ndarray]): _description_
+            embedding_list (np.ndarray): Embeddings of shape (N, EMBEDDING_SIZE)
         Returns:
-            List: _description_
+            np.ndarray: Average embedding of shape (EMBEDDING_SIZE,)
         
         """
-        avg_embed = np.mean(embedding_list, axis=0)
-        return avg_embed.tolist()
+        return np.mean(embedding_list, axis=0)
 
     @staticmethod
-    def cosine_simmilarity(db_embedding, current_embedding) -> bool:
+    def cosine_simmilarity(db_embedding, current_embedding, normalized: bool = False) -> bool:
         """Function to calculate cosine similarity between two embeddings
         Args:
             db_embedding (list): This embedding is extracted from the database
             current_embedding (list): This embedding is extracted from the current images
+            normalized (bool): db_embedding is already unit length
         Returns:
             int: simmilarity value
         """
         try:
-            return np.dot(db_embedding, current_embedding) / (
-                np.linalg.norm(db_embedding) * np.linalg.norm(current_embedding)
-            )
+            with timed("similarity", SIMILARITY_SECONDS):
+                if normalized:
+                    return np.dot(db_embedding, current_embedding) / np.linalg.norm(
+                        current_embedding
+                    )
+                return np.dot(db_embedding, current_embedding) / (
+                    np.linalg.norm(db_embedding) * np.linalg.norm(current_embedding)
+                )
+        except Exception as e:
+            raise AppException(e, sys) from e
+
+    @staticmethod
+    def fuse_scores(
+        scores: np.ndarray, rule: str = TEMPLATE_FUSION, top_k: int = TEMPLATE_FUSION_TOP_K
+    ) -> float:
+        """Combine the similarities against every template into one score
+        Args:
+            scores (np.ndarray): Similarity per template
+            rule (str): "max", "mean" or "top_k"
+            top_k (int): Number of best scores averaged by "top_k"
+        Returns:
+            float: Fused similarity
+        """
+        if rule == "max":
+            return float(scores.max())
+        if rule == "mean":
+            return float(scores.mean())
+        if rule == "top_k":
+            top_k = min(top_k, len(scores))
+            return float(np.partition(scores, len(scores) - top_k)[-top_k:].mean())
+        raise ValueError(f"Unknown template fusion rule: {rule}")
+
+    @staticmethod
+    def template_simmilarity(
+        templates: np.ndarray, current_embedding: np.ndarray
+    ) -> Tuple[float, np.ndarray]:
+        """Score the current embedding against every template of the user with
+        a single matrix product
+        Args:
+            templates (np.ndarray): Unit length templates of shape (T, EMBEDDING_SIZE)
+            current_embedding (np.ndarray): Embedding of the current images
+        Returns:
+            Tuple[float, np.ndarray]: Fused similarity and the score per template
+        """
+        try:
+            with timed("similarity", SIMILARITY_SECONDS):
+                scores = templates @ (current_embedding / np.linalg.norm(current_embedding))
+                return UserLoginEmbeddingValidation.fuse_scores(scores), scores
         except Exception as e:
             raise AppException(e, sys) from e
 
+    def verify_all(self, faces: Iterable[UploadedFace]) -> float:
+        """Embed every frame in one batch and compare their mean
+        Args:
+            faces (Iterable[UploadedFace]): Extracted faces
+        Returns:
+            float: Similarity of the mean of all frames
+        """
+        # Generate embedding list
+
+        logging.info("Generating Embedding List .......")
+        embedding_list = UserLoginEmbeddingValidation.generate_face_embeddings(
+            list(faces)
+        )
+
+        self.frames_processed = len(embedding_list)
+        logging.info("Embedding List generated.......")
+        # Calculate average embedding
+
+        logging.info("Calculating Average Embedding .......")
+        avg_embedding_list = UserLoginEmbeddingValidation.average_embedding( embedding_list)
+        logging.info("Average Embedding calculated.......")
+
+        logging.info("Calculating Cosine Similarity .......")
+        # Calculate cosine similarity against every template
+        self.probe_embedding = avg_embedding_list
+        simmilarity, self.template_scores = UserLoginEmbeddingValidation.template_simmilarity(
+            self.user["user_templates"], avg_embedding_list
+        )
+        return simmilarity
+
+    def add_embeddings(self, embeddings: np.ndarray) -> float:
+        """Fold the embeddings of more frames into the running mean and score
+        it against the templates
+        Args:
+            embeddings (np.ndarray): Embeddings of shape (N, EMBEDDING_SIZE)
+        Returns:
+            float: Similarity of the mean of every frame added so far
+        """
+        embedding_sum = np.sum(embeddings, axis=0)
+        if self.embedding_sum is not None:
+            embedding_sum = embedding_sum + self.embedding_sum
+        self.embedding_sum = embedding_sum
+        self.frames_processed += len(embeddings)
+        self.probe_embedding = self.embedding_sum / self.frames_processed
+        simmilarity, self.template_scores = UserLoginEmbeddingValidation.template_simmilarity(
+            self.user["user_templates"], self.probe_embedding
+        )
+        return simmilarity
+
+    def is_certain(self, simmilarity: float) -> bool:
+        """Whether more frames can no longer change the decision"""
+        if self.frames_processed >= EARLY_EXIT_MIN_FRAMES and (
+            abs(simmilarity - SIMILARITY_THRESHOLD) >= EARLY_EXIT_MARGIN
+        ):
+            logging.info(f"Decision certain after {self.frames_processed} frames.......")
+            return True
+        return False
+
+    def verify_incrementally(self, faces: Iterable[UploadedFace]) -> float:
+        """Embed the frames one by one and stop as soon as the similarity of
+        the running mean is clearly above or below the threshold
+        Args:
+            faces (Iterable[UploadedFace]): Extracted faces. A generator that
+                extracts them is consumed lazily, so that the frames after
+                the decision are never detected.
+        Returns:
+            float: Similarity of the mean of the processed frames
+        """
+        for face in faces:
+            simmilarity = self.add_embeddings(
+                UserLoginEmbeddingValidation.generate_face_embeddings([face])
+            )
+            if self.is_certain(simmilarity):
+                break
+        return simmilarity
+
     def compare_embedding(self, files: bytes) -> bool:
         """Function to compare the embedding of the current image with the embedding of the database
         Args:
@@ -104,6 +343,19 @@ class UserLoginEmbeddingValidation:
         Returns:
             bool: Returns True if the similarity is greater than the threshold
         """
+        faces = (
+            UserLoginEmbeddingValidation.extract_face_from_bytes(contents)
+            for contents in files
+        )
+        return self.compare_faces(faces)
+
+    def compare_faces(self, faces: Iterable[UploadedFace]) -> bool:
+        """Function to compare already extracted faces with the embedding of the database
+        Args:
+            faces (Iterable[UploadedFace]): Faces returned by extract_face_from_bytes
+        Returns:
+            bool: Returns True if the similarity is greater than the threshold
+        """
         try:
 
             if self.user:
@@ -113,42 +365,77 @@ class UserLoginEmbeddingValidation:
                     return False
 
                 logging.info("Embedding Validation Successfull.......")
-                # Generate embedding list
-
-                logging.info("Generating Embedding List .......")
-                embedding_list = UserLoginEmbeddingValidation.generate_embedding_list(
-                    files
-                )
-
-                logging.info("Embedding List generated.......")
-                # Calculate average embedding
-
-                logging.info("Calculating Average Embedding .......")
-                avg_embedding_list = UserLoginEmbeddingValidation.average_embedding( embedding_list)
-                logging.info("Average Embedding calculated.......")
-
-                # Get embedding from database
-                db_embedding = self.user["user_embed"]
-
-                logging.info("Calculating Cosine Similarity .......")
-                # Calculate cosine similarity
-                simmilarity = UserLoginEmbeddingValidation.cosine_simmilarity(
-                    db_embedding, avg_embedding_list
-                )
-                logging.info("Cosine Similarity calculated.......")
 
-                if simmilarity >= SIMILARITY_THRESHOLD:
-                    logging.info("User Authenticated Successfully.......")
-                    return True
+                if EARLY_EXIT_VERIFICATION:
+                    logging.info("Verifying frames incrementally .......")
+                    simmilarity = self.verify_incrementally(faces)
                 else:
-                    logging.info("User Authentication Failed.......")
-                    return False
+                    simmilarity = self.verify_all(faces)
+                logging.info("Cosine Similarity calculated.......")
+                return self.decide(simmilarity)
             logging.info("User Authentication Failed.......")
 
             return False
         except Exception as e:
             raise AppException(e, sys) from e
 
+    def decide(self, simmilarity: float) -> bool:
+        """Accept the login if the similarity reaches the threshold, and add
+        the probe of a confident accept to the templates"""
+        if simmilarity >= SIMILARITY_THRESHOLD:
+            logging.info("User Authenticated Successfully.......")
+            VERIFICATION_DECISIONS.labels(result="accept").inc()
+            if simmilarity >= TEMPLATE_UPDATE_THRESHOLD:
+                self.update_templates()
+            return True
+        logging.info("User Authentication Failed.......")
+        VERIFICATION_DECISIONS.labels(result="reject").inc()
+        return False
+
+    def update_templates(self) -> None:
+        """Add the probe of a confident login to the templates of the user.
+
+        When the set is full the probe replaces its most similar template, the
+        most redundant one. Probes that are near duplicates of a template add
+        nothing and are skipped. The write only succeeds if nobody wrote the
+        templates since they were read, otherwise the update starts again
+        from the stored templates, so concurrent logins of the same user do
+        not lose each other's probe.
+        """
+        try:
+            probe = self.probe_embedding / np.linalg.norm(self.probe_embedding)
+            template_scores = self.template_scores
+            for _ in range(TEMPLATE_UPDATE_ATTEMPTS):
+                if template_scores.max() >= TEMPLATE_DUPLICATE_SIMILARITY:
+                    return
+                templates = self.user["user_templates"]
+                if len(templates) < MAX_TEMPLATES_PER_USER:
+                    templates = np.vstack([templates, probe])
+                else:
+                    templates = templates.copy()
+                    templates[np.argmax(template_scores)] = probe
+                if self.user_embedding_data.update_user_templates(
+                    self.user_id, templates, self.user["template_version"]
+                ):
+                    self.user["user_templates"] = templates
+                    self.user["template_version"] += 1
+                    logging.info(
+                        f"Updated the templates of the user, {len(templates)} kept......."
+                    )
+                    return
+                stored = self.user_embedding_data.get_user_templates(
+                    self.user_id, cached=False
+                )
+                if stored is None:
+                    return
+                self.user["user_templates"], self.user["template_version"] = stored
+                template_scores = self.user["user_templates"] @ probe
+            logging.info("Templates of the user kept changing, update skipped.......")
+        except Exception:
+            # The login already succeeded, a failed update must not undo it
+            logging.exception("Updating the templates of the user failed.......")
+
+
 class UserRegisterEmbeddingValidation:
     def __init__(self, user_id: str) -> None:
         self.user_id = user_id
@@ -161,9 +448,37 @@ class UserRegisterEmbeddingValidation:
         Returns:
             Embedding: saves the image to database
         """
+        faces = [
+            UserLoginEmbeddingValidation.extract_face_from_bytes(contents)
+            for contents in files
+        ]
+        self.save_faces(faces)
+
+    @staticmethod
+    def select_templates(embedding_list: np.ndarray) -> np.ndarray:
+        """Keep at most MAX_TEMPLATES_PER_USER frames, evenly spread over the
+        registration so that the kept ones differ the most"""
+        if len(embedding_list) <= MAX_TEMPLATES_PER_USER:
+            return embedding_list
+        rows = np.linspace(0, len(embedding_list) - 1, MAX_TEMPLATES_PER_USER)
+        return embedding_list[np.rint(rows).astype(int)]
+
+    def save_faces(self, faces: List[UploadedFace]):
+        """This function will embed already extracted faces and save their mean
+        and a template per frame to database
+        Args:
+            faces (List[UploadedFace]): Faces returned by extract_face_from_bytes
+        """
         try:
-            embedding_list = UserLoginEmbeddingValidation.generate_embedding_list(files)
+            embedding_list = UserLoginEmbeddingValidation.generate_face_embeddings(faces)
             avg_embedding_list = UserLoginEmbeddingValidation.average_embedding( embedding_list )
-            self.user_embedding_data.save_user_embedding(self.user_id, avg_embedding_list)
+            self.user_embedding_data.save_user_embedding(
+                self.user_id,
+                avg_embedding_list,
+                UserRegisterEmbeddingValidation.select_templates(embedding_list),
+            )
+            # Keep the identification gallery of this process up to date
+            if EmbeddingGallery.gallery is not None:
+                EmbeddingGallery.gallery.add(self.user_id, avg_embedding_list)
         except Exception as e:
             raise AppException(e, sys) from e
\ No newline at end of file